@@ -0,0 +1,268 @@
+"""Асинхронные версии основных эндпоинтов чтения для работы под ASGI.
+
+Django 3.2 не умеет выполнять запросы ORM из корутин, поэтому каждый
+запрос к базе уходит в пул потоков через sync_to_async. Независимые
+запросы одного HTTP-запроса (общая часть рецептов и флаги
+пользователя) выполняются при этом параллельно, а рабочий процесс
+не простаивает, пока база отвечает.
+
+Ответы совпадают с синхронными эндпоинтами /api/recipes/, /api/tags/,
+/api/ingredients/ и /api/users/subscriptions/: пагинация, ETag и
+ответы 304 берутся из тех же классов и функций.
+"""
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django_filters.utils import translate_validation
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import BooleanField, Value
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed
+from django.utils.http import parse_etags
+
+from foodgram.metrics import cache_requests_total
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.search import ingredient_index
+
+from .filters import RecipeFilter
+from .mixins import (check_conditions, get_reference_cache_key,
+                     set_conditional_headers)
+from .pagination import CustomPagination, RecipePagination
+from .serializers import (IngredientSerializer, SubscriptionSerializer,
+                          TagSerializer, get_recipe_flags_map,
+                          get_recipes_limit, get_shared_representations,
+                          overlay_recipe_flags)
+from .views import (attach_latest_recipes, get_recipe_list_validators,
+                    get_recipe_validators)
+
+User = get_user_model()
+
+
+def in_thread(func, *args, **kwargs):
+    """Вызов синхронного кода с ORM в пуле потоков.
+
+    thread_sensitive=False позволяет нескольким вызовам одного
+    запроса идти параллельно, каждый со своим подключением к базе.
+    Подключение закрывается или переиспользуется по CONN_MAX_AGE,
+    как в конце обычного запроса.
+    """
+
+    def call():
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(call, thread_sensitive=False)()
+
+
+def render(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(
+        JSONRenderer().render(data),
+        content_type=JSONRenderer.media_type,
+        status=status_code,
+    )
+
+
+def async_api_view(view):
+    """Аутентификация DRF и ответы об ошибках для асинхронного view."""
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return HttpResponseNotAllowed(('GET', 'HEAD'))
+        drf_request = Request(request, authenticators=[
+            authentication()
+            for authentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+        ])
+        try:
+            await in_thread(getattr, drf_request, 'user')
+            return await view(drf_request, *args, **kwargs)
+        except Http404:
+            return render(
+                {'detail': exceptions.NotFound.default_detail},
+                status.HTTP_404_NOT_FOUND,
+            )
+        except exceptions.APIException as error:
+            detail = error.detail
+            if not isinstance(detail, (list, dict)):
+                detail = {'detail': detail}
+            return render(detail, error.status_code)
+
+    return wrapper
+
+
+async def represent(recipes, request):
+    """Общая часть рецептов и флаги пользователя параллельно."""
+
+    shared, flags = await asyncio.gather(
+        in_thread(get_shared_representations, recipes, {'request': request}),
+        in_thread(
+            get_recipe_flags_map,
+            request.user,
+            [recipe.pk for recipe in recipes],
+        ),
+    )
+    return overlay_recipe_flags(recipes, shared, flags)
+
+
+def filter_recipes(request):
+    filterset = RecipeFilter(
+        request.query_params,
+        queryset=Recipe.objects.only('id', 'pub_date', 'updated_at'),
+        request=request,
+    )
+    if not filterset.is_valid():
+        raise translate_validation(filterset.errors)
+    return filterset.qs
+
+
+@async_api_view
+async def recipe_list(request):
+    """Список рецептов с фильтрами и пагинацией, как /api/recipes/.
+
+    Страница выбирается тем же RecipePagination, а ETag и ответ 304
+    строятся теми же валидаторами, что и в RecipeViewSet.
+    """
+
+    paginator = RecipePagination()
+
+    def select_page():
+        recipes = paginator.paginate_queryset(
+            filter_recipes(request), request
+        )
+        return recipes, get_recipe_list_validators(
+            paginator, recipes, request.user
+        )
+
+    recipes, validators = await in_thread(select_page)
+    etag, last_modified, response = check_conditions(
+        request, validators, JSONRenderer.format
+    )
+    if response is None:
+        data = await represent(recipes, request)
+        response = render(paginator.get_paginated_response(data).data)
+    return set_conditional_headers(response, etag, last_modified)
+
+
+@async_api_view
+async def recipe_detail(request, pk):
+    """Рецепт по id, как /api/recipes/<id>/, с тем же ETag и 304.
+
+    Флаги пользователя зависят только от id, поэтому запрашиваются
+    одновременно с самим рецептом.
+    """
+
+    validators = await in_thread(get_recipe_validators, pk, request.user)
+    if validators is None:
+        raise exceptions.NotFound
+    etag, last_modified, response = check_conditions(
+        request, validators, JSONRenderer.format
+    )
+    if response is not None:
+        return set_conditional_headers(response, etag, last_modified)
+
+    recipe, flags = await asyncio.gather(
+        in_thread(
+            Recipe.objects.only('id', 'pub_date', 'updated_at')
+            .filter(pk=pk).first
+        ),
+        in_thread(get_recipe_flags_map, request.user, [pk]),
+    )
+    if recipe is None:
+        raise exceptions.NotFound
+    shared = await in_thread(
+        get_shared_representations, [recipe], {'request': request}
+    )
+    return set_conditional_headers(
+        render(overlay_recipe_flags([recipe], shared, flags)[0]),
+        etag, last_modified,
+    )
+
+
+async def reference_response(request, namespace, build):
+    """Ответ справочника из кэша, как в ReferenceCacheMixin."""
+
+    def respond():
+        etag, key = get_reference_cache_key(namespace, request)
+        cache_name = f'reference:{namespace}'
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            cache_requests_total.labels(cache_name, 'not_modified').inc()
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = etag
+            return response
+
+        content = cache.get(key)
+        cache_requests_total.labels(
+            cache_name, 'miss' if content is None else 'hit'
+        ).inc()
+        if content is None:
+            content = JSONRenderer().render(build())
+            cache.set(key, content, settings.REFERENCE_CACHE_TIMEOUT)
+        response = HttpResponse(
+            content, content_type=JSONRenderer.media_type
+        )
+        response['ETag'] = etag
+        return response
+
+    return await in_thread(respond)
+
+
+@async_api_view
+async def tag_list(request):
+    """Список тегов, как /api/tags/."""
+
+    return await reference_response(
+        request,
+        'tags',
+        lambda: TagSerializer(Tag.objects.all(), many=True).data,
+    )
+
+
+@async_api_view
+async def ingredient_list(request):
+    """Список ингредиентов и поиск по ?name=, как /api/ingredients/."""
+
+    name = request.query_params.get('name')
+    if name:
+        return render(await in_thread(
+            ingredient_index.search, name, settings.INGREDIENT_SEARCH_LIMIT
+        ))
+    return await reference_response(
+        request,
+        'ingredients',
+        lambda: IngredientSerializer(Ingredient.objects.all(), many=True).data,
+    )
+
+
+@async_api_view
+async def subscriptions(request):
+    """Подписки пользователя, как /api/users/subscriptions/."""
+
+    if not request.user.is_authenticated:
+        raise exceptions.NotAuthenticated
+    queryset = User.objects.filter(
+        subscribing__user=request.user
+    ).annotate(
+        is_subscribed=Value(True, output_field=BooleanField()),
+    ).order_by('id')
+    paginator = CustomPagination()
+
+    def select_page():
+        authors = paginator.paginate_queryset(queryset, request)
+        attach_latest_recipes(authors, get_recipes_limit(request))
+        return authors
+
+    authors = await in_thread(select_page)
+    serializer = SubscriptionSerializer(
+        authors, many=True, context={'request': request}
+    )
+    return render(paginator.get_paginated_response(serializer.data).data)
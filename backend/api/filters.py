@@ -1,32 +1,124 @@
 from django_filters.rest_framework import FilterSet, filters
-from recipes.models import Recipe, Tag
+
+from django import forms
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Exists, OuterRef
+
+from recipes.cache import get_version
+from recipes.fulltext import search_recipes
+from recipes.models import Favorite, Recipe, ShoppingCard, Tag
 
 User = get_user_model()
 
+TAG_IDS_KEY = 'reference:tags:{version}:ids'
+
+
+def get_tag_ids(slugs):
+    """id тегов по slug из кэша версии справочника тегов.
+
+    Неизвестные slug пропускаются. Словарь строится по основной базе,
+    чтобы отставшая реплика не попала в кэш под новой версией.
+    """
+
+    key = TAG_IDS_KEY.format(version=get_version('tags'))
+    tag_ids = cache.get(key)
+    if tag_ids is None:
+        tag_ids = dict(
+            Tag.objects.using(DEFAULT_DB_ALIAS).values_list('slug', 'id')
+        )
+        cache.set(key, tag_ids, settings.REFERENCE_CACHE_TIMEOUT)
+    return [tag_ids[slug] for slug in slugs if slug in tag_ids]
+
+
+class MultipleValueField(forms.Field):
+    """Все значения повторяющегося параметра без проверки по базе."""
+
+    widget = forms.MultipleHiddenInput
+
+
+class MultipleValueFilter(filters.Filter):
+    field_class = MultipleValueField
+
+
 class RecipeFilter(FilterSet):
-    """Фильтр рецептов."""
+    """Фильтр рецептов.
 
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all()
-    )
+    Теги проверяются через EXISTS, избранное и список покупок — через
+    IN по строкам пользователя. Оба условия идут по уникальным индексам
+    связей, поэтому рецепт попадает в выдачу один раз без DISTINCT.
+    """
+
+    author = filters.NumberFilter(field_name='author')
+    tags = MultipleValueFilter(method='filter_tags')
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
+    is_in_shopping_cart = filters.BooleanFilter(
+        method='filter_is_in_shopping_cart'
+    )
+    # Прежнее имя параметра.
     is_in_shopping_list = filters.BooleanFilter(
-        method='filter_is_in_shopping_list'
+        method='filter_is_in_shopping_cart'
+    )
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=(
+            ('-favorites_count', 'Сначала популярные'),
+            ('favorites_count', 'Сначала непопулярные'),
+            ('-pub_date', 'Сначала новые'),
+            ('pub_date', 'Сначала старые'),
+        ),
+        method='filter_ordering',
     )
 
     class Meta:
         model = Recipe
         fields = ('author', 'tags')
 
-    def filter_is_favorited(self, queryset, name, value):
-        if self.request.user.is_authenticated and value:
-            return queryset.filter(favorites__user=self.request.user)
-        return queryset
+    def filter_tags(self, queryset, name, value):
+        """Рецепты хотя бы с одним из тегов."""
+
+        tag_ids = get_tag_ids(value)
+        if not tag_ids:
+            return queryset.none()
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'), tag_id__in=tag_ids
+        )))
+
+    def filter_search(self, queryset, name, value):
+        """Полнотекстовый поиск по названию и тексту рецепта.
+
+        Результаты упорядочены по релевантности, если не задан ordering.
+        """
+
+        return search_recipes(queryset, value).order_by('-search_rank', '-id')
+
+    def filter_ordering(self, queryset, name, value):
+        """Сортировка с id для стабильного порядка при равных значениях.
+
+        Для -favorites_count используется индекс recipe_favorites_count_idx.
+        """
+
+        direction = '-' if value.startswith('-') else ''
+        return queryset.order_by(value, f'{direction}id')
+
+    def filter_user_relation(self, queryset, model, value):
+        """Рецепты из связей пользователя.
+
+        Связей у одного пользователя немного, поэтому выборка идёт
+        от них по индексу (user, recipe), а не перебором рецептов
+        с подзапросом для каждого.
+        """
 
-    def filter_is_in_shopping_list(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
-            return queryset.filter(shopping_list__user=self.request.user)
+            return queryset.filter(pk__in=model.objects.filter(
+                user=self.request.user
+            ).values('recipe_id'))
         return queryset
+
+    def filter_is_favorited(self, queryset, name, value):
+        return self.filter_user_relation(queryset, Favorite, value)
+
+    def filter_is_in_shopping_cart(self, queryset, name, value):
+        return self.filter_user_relation(queryset, ShoppingCard, value)
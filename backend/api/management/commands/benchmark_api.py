@@ -0,0 +1,180 @@
+import json
+from pathlib import Path
+from statistics import median, quantiles
+from time import perf_counter
+
+from rest_framework.test import APIClient
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from recipes.models import IngredientInRecipe, Recipe, Tag
+
+User = get_user_model()
+
+
+def percentile(values, percent):
+    if len(values) < 2:
+        return values[0]
+    return quantiles(values, n=100, method='inclusive')[percent - 1]
+
+
+def get_benchmark_user():
+    """Пользователь с подписками и списком покупок для замеров."""
+
+    user = User.objects.annotate(
+        carts=Count('shopping_cart', distinct=True),
+        follows=Count('subscriber', distinct=True),
+    ).filter(carts__gt=0, follows__gt=0).order_by('-follows').first()
+    if user is None:
+        raise CommandError(
+            'Нет пользователя с подписками и списком покупок. '
+            'Сначала выполните seed_perf_data.'
+        )
+    return user
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер времени ответа и числа SQL-запросов ключевых эндпоинтов API '
+        'с сохранением результатов в JSON и сравнением с базовой линией.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Количество запросов к каждому эндпоинту.')
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--output', default='perf_baseline.json',
+                            help='Файл для сохранения результатов.')
+        parser.add_argument('--compare',
+                            help='Файл базовой линии для сравнения.')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Допустимый рост p95 относительно базы.')
+
+    def get_scenarios(self):
+        recipe = Recipe.objects.order_by('-pub_date').first()
+        tags = '&'.join(
+            f'tags={slug}'
+            for slug in Tag.objects.values_list('slug', flat=True)[:2]
+        )
+        all_tags = '&'.join(
+            f'tags={slug}'
+            for slug in Tag.objects.values_list('slug', flat=True)
+        )
+        pantry = '&'.join(
+            f'ingredients={pk}'
+            for pk in IngredientInRecipe.objects.values_list(
+                'ingredient', flat=True
+            ).annotate(uses=Count('id')).order_by('-uses')[:20]
+        )
+        return {
+            'recipes_list': ('/api/recipes/?limit=6', False),
+            'recipes_list_limit_50': ('/api/recipes/?limit=50', False),
+            'recipes_list_filters': (
+                f'/api/recipes/?{tags}&is_favorited=1&limit=6', True
+            ),
+            'recipes_list_all_tags': (
+                f'/api/recipes/?{all_tags}&limit=6', False
+            ),
+            'recipes_list_cart': (
+                '/api/recipes/?is_in_shopping_cart=1&limit=6', True
+            ),
+            'recipes_list_tags_favorited_cart': (
+                f'/api/recipes/?{all_tags}&is_favorited=1'
+                '&is_in_shopping_cart=1&limit=6',
+                True,
+            ),
+            'recipes_list_cursor': ('/api/recipes/?cursor=&limit=6', True),
+            'recipes_search': ('/api/recipes/?search=рецепт&limit=6', False),
+            'recipes_pantry': (f'/api/recipes/pantry/?{pantry}', False),
+            'recipe_detail': (f'/api/recipes/{recipe.id}/', True),
+            'subscriptions': (
+                '/api/users/subscriptions/?recipes_limit=3&limit=6', True
+            ),
+            'download_shopping_card': (
+                '/api/recipes/download_shopping_card/', True
+            ),
+            'download_shopping_card_csv': (
+                '/api/recipes/download_shopping_card/?format=csv', True
+            ),
+            'ingredients_search': ('/api/ingredients/?name=мо', False),
+            'tags': ('/api/tags/', False),
+        }
+
+    def measure(self, client, url, count, warmup):
+        timings = []
+        queries = []
+        for number in range(warmup + count):
+            with CaptureQueriesContext(connection) as context:
+                started = perf_counter()
+                response = client.get(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                elapsed = (perf_counter() - started) * 1000
+            if response.status_code != 200:
+                raise CommandError(f'{url}: статус {response.status_code}')
+            if number >= warmup:
+                timings.append(elapsed)
+                queries.append(len(context.captured_queries))
+        return {
+            'url': url,
+            'requests': count,
+            'queries': max(queries),
+            'p50_ms': round(median(timings), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+        }
+
+    def handle(self, *args, **options):
+        user = get_benchmark_user()
+        anonymous = APIClient()
+        authorized = APIClient()
+        authorized.force_authenticate(user)
+
+        results = {}
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for name, (url, auth) in self.get_scenarios().items():
+                results[name] = self.measure(
+                    authorized if auth else anonymous,
+                    url,
+                    options['requests'],
+                    options['warmup'],
+                )
+                self.stdout.write(
+                    f'{name:30} queries={results[name]["queries"]:<4} '
+                    f'p50={results[name]["p50_ms"]:>8.2f} ms '
+                    f'p95={results[name]["p95_ms"]:>8.2f} ms'
+                )
+
+        Path(options['output']).write_text(
+            json.dumps(results, ensure_ascii=False, indent=2),
+            encoding='utf-8',
+        )
+        self.stdout.write(f'Результаты сохранены в {options["output"]}.')
+
+        if options['compare']:
+            self.compare(results, options['compare'], options['tolerance'])
+
+    def compare(self, results, path, tolerance):
+        baseline = json.loads(Path(path).read_text(encoding='utf-8'))
+        regressions = []
+        for name, result in results.items():
+            base = baseline.get(name)
+            if base is None:
+                continue
+            if result['queries'] > base['queries']:
+                regressions.append(
+                    f'{name}: запросов {base["queries"]} -> '
+                    f'{result["queries"]}'
+                )
+            if result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+                regressions.append(
+                    f'{name}: p95 {base["p95_ms"]} -> {result["p95_ms"]} ms'
+                )
+        if regressions:
+            raise CommandError(
+                'Обнаружены регрессии:\n' + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS('Регрессий не обнаружено.'))
@@ -0,0 +1,176 @@
+import json
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from statistics import median
+from time import perf_counter, sleep
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from rest_framework.authtoken.models import Token
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.management.commands.benchmark_api import (get_benchmark_user,
+                                                   percentile)
+from recipes.models import Recipe
+
+STARTUP_TIMEOUT = 30
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнение пропускной способности и задержек эндпоинтов чтения '
+        'под gunicorn (WSGI) и gunicorn с uvicorn-воркерами (ASGI) '
+        'при одинаковом числе процессов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2,
+                            help='Число процессов каждого сервера.')
+        parser.add_argument('--concurrency', type=int, default=16,
+                            help='Число одновременных клиентов.')
+        parser.add_argument('--requests', type=int, default=400,
+                            help='Количество запросов на сценарий.')
+        parser.add_argument('--wsgi-port', type=int, default=8101)
+        parser.add_argument('--asgi-port', type=int, default=8102)
+        parser.add_argument('--output', default='perf_servers.json',
+                            help='Файл для сохранения результатов.')
+
+    def get_scenarios(self):
+        """Пары путей: синхронный эндпоинт и его асинхронная версия."""
+
+        recipe = Recipe.objects.order_by('-pub_date').first()
+        return {
+            'recipes_list': ('recipes/?limit=6', False),
+            'recipes_list_auth': ('recipes/?limit=6', True),
+            'recipes_list_limit_50': ('recipes/?limit=50', True),
+            'recipe_detail': (f'recipes/{recipe.id}/', True),
+            'subscriptions': (
+                'users/subscriptions/?recipes_limit=3&limit=6', True
+            ),
+            'ingredients_search': (
+                f'ingredients/?{urlencode({"name": "мо"})}', False
+            ),
+            'tags': ('tags/', False),
+        }
+
+    def get_servers(self, options):
+        bind = '127.0.0.1:{port}'
+        common = (
+            '--workers', str(options['workers']),
+            '--log-level', 'warning',
+        )
+        return {
+            'wsgi': (
+                options['wsgi_port'],
+                '/api/',
+                (
+                    sys.executable, '-m', 'gunicorn', 'foodgram.wsgi',
+                    '--bind', bind.format(port=options['wsgi_port']),
+                    *common,
+                ),
+            ),
+            'asgi': (
+                options['asgi_port'],
+                '/api/async/',
+                (
+                    sys.executable, '-m', 'gunicorn', 'foodgram.asgi',
+                    '--worker-class', 'uvicorn.workers.UvicornWorker',
+                    '--bind', bind.format(port=options['asgi_port']),
+                    *common,
+                ),
+            ),
+        }
+
+    def handle(self, *args, **options):
+        token = Token.objects.get_or_create(user=get_benchmark_user())[0]
+        scenarios = self.get_scenarios()
+        results = {}
+        for server, (port, prefix, command) in self.get_servers(
+            options
+        ).items():
+            base_url = f'http://127.0.0.1:{port}'
+            process = subprocess.Popen(
+                command, cwd=settings.BASE_DIR, env=os.environ.copy()
+            )
+            try:
+                self.wait_ready(process, f'{base_url}/api/tags/')
+                for name, (path, auth) in scenarios.items():
+                    result = self.load(
+                        f'{base_url}{prefix}{path}',
+                        {'Authorization': f'Token {token.key}'} if auth
+                        else {},
+                        options['requests'],
+                        options['concurrency'],
+                    )
+                    results.setdefault(name, {})[server] = result
+                    self.stdout.write(
+                        f'{name:25} {server} '
+                        f'rps={result["rps"]:>8.1f} '
+                        f'p50={result["p50_ms"]:>8.2f} ms '
+                        f'p95={result["p95_ms"]:>8.2f} ms '
+                        f'p99={result["p99_ms"]:>8.2f} ms '
+                        f'errors={result["errors"]}'
+                    )
+            finally:
+                process.terminate()
+                process.wait()
+
+        Path(options['output']).write_text(
+            json.dumps(results, ensure_ascii=False, indent=2),
+            encoding='utf-8',
+        )
+        self.stdout.write(f'Результаты сохранены в {options["output"]}.')
+
+    def wait_ready(self, process, url):
+        deadline = perf_counter() + STARTUP_TIMEOUT
+        while perf_counter() < deadline:
+            if process.poll() is not None:
+                raise CommandError(
+                    f'Сервер завершился с кодом {process.returncode}.'
+                )
+            try:
+                urlopen(url, timeout=1).read()
+                return
+            except (URLError, ConnectionError):
+                sleep(0.2)
+        raise CommandError(f'Сервер не ответил на {url}.')
+
+    def fetch(self, url, headers):
+        started = perf_counter()
+        try:
+            with urlopen(Request(url, headers=headers), timeout=30) as reply:
+                reply.read()
+                ok = reply.status == 200
+        except (HTTPError, URLError, ConnectionError):
+            ok = False
+        return (perf_counter() - started) * 1000, ok
+
+    def load(self, url, headers, count, concurrency):
+        """Запросы от concurrency клиентов одновременно."""
+
+        for _ in range(concurrency):
+            self.fetch(url, headers)
+        started = perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            replies = list(executor.map(
+                lambda _: self.fetch(url, headers), range(count)
+            ))
+        elapsed = perf_counter() - started
+        timings = [timing for timing, ok in replies if ok]
+        if not timings:
+            raise CommandError(f'{url}: нет успешных ответов.')
+        return {
+            'url': url,
+            'requests': count,
+            'errors': count - len(timings),
+            'rps': round(len(timings) / elapsed, 1),
+            'p50_ms': round(median(timings), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'p99_ms': round(percentile(timings, 99), 2),
+        }
@@ -0,0 +1,277 @@
+from hashlib import md5
+
+from rest_framework import status
+from rest_framework.response import Response
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags, quote_etag, urlencode
+
+from foodgram.db import use_primary
+from foodgram.metrics import cache_requests_total
+from recipes.cache import get_version
+from recipes.counters import change_counter, lock_rows
+
+from .serializers import BulkDeleteSerializer, BulkIdsSerializer
+
+
+def get_reference_cache_key(namespace, request, query_params=()):
+    """ETag и ключ кэша ответа справочника для текущей его версии.
+
+    Ключ строится по пути и значениям только параметров query_params:
+    остальные параметры на ответ не влияют, и по ним не должны
+    накапливаться копии одного и того же ответа.
+    """
+
+    version = get_version(namespace)
+    params = urlencode(sorted(
+        (name, value)
+        for name in query_params
+        for value in request.GET.getlist(name)
+    ))
+    digest = md5(f'{request.path}?{params}'.encode()).hexdigest()
+    return (
+        quote_etag(f'{namespace}-{version}-{digest}'),
+        f'reference:{namespace}:{version}:{digest}',
+    )
+
+
+class ReferenceCacheMixin:
+    """Кэширование готовых JSON-ответов справочника.
+
+    Ответы хранятся в кэше Django под ключом с текущей версией
+    справочника (см. recipes.cache), поэтому при изменении данных
+    старые ключи просто перестают использоваться. Клиент получает
+    ETag и ответ 304 на повторный запрос с If-None-Match. Параметры
+    запроса, от которых зависит ответ, перечисляются в cache_query_params.
+    """
+
+    cache_namespace = None
+    cache_query_params = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if renderer.format != 'json':
+            return handler(request, *args, **kwargs)
+
+        etag, key = get_reference_cache_key(
+            self.cache_namespace, request, self.cache_query_params
+        )
+        cache_name = f'reference:{self.cache_namespace}'
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            cache_requests_total.labels(cache_name, 'not_modified').inc()
+            return Response(status=status.HTTP_304_NOT_MODIFIED,
+                            headers={'ETag': etag})
+
+        content = cache.get(key)
+        cache_requests_total.labels(
+            cache_name, 'miss' if content is None else 'hit'
+        ).inc()
+        if content is None:
+            # Ответ запоминается под текущей версией справочника,
+            # поэтому строится по основной базе, а не по реплике.
+            with use_primary():
+                response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            content = renderer.render(
+                response.data,
+                request.accepted_media_type,
+                self.get_renderer_context(),
+            )
+            cache.set(key, content, settings.REFERENCE_CACHE_TIMEOUT)
+
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        response = HttpResponse(content, content_type=content_type)
+        response['ETag'] = etag
+        return response
+
+
+class BulkRelationMixin:
+    """Массовое добавление и удаление связей пользователя.
+
+    Общая часть избранного, списка покупок и подписок: список id
+    обрабатывается одним bulk_create или одним DELETE, а в ответе
+    для каждого id указывается, что с ним произошло.
+    """
+
+    def bulk_relation(self, request, model, field, targets, counter,
+                      forbidden=(), on_change=None):
+        if request.method == 'POST':
+            return self.bulk_add(
+                request, model, field, targets, counter, forbidden, on_change
+            )
+        return self.bulk_delete(
+            request, model, field, targets, counter, on_change
+        )
+
+    def bulk_add(self, request, model, field, targets, counter,
+                 forbidden=(), on_change=None):
+        """Добавление связей: created, exists, not_found или forbidden.
+
+        Строки targets блокируются на время транзакции (lock_rows),
+        поэтому created содержит ровно вставленные связи. Счётчик
+        counter у объектов targets меняется одним UPDATE.
+        on_change(user_id, ids, 1) обновляет зависящие от связей данные
+        в той же транзакции.
+        """
+
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        user = request.user
+        with transaction.atomic():
+            # Наличие связей читается уже под блокировкой: иначе
+            # параллельный запрос успеет вставить ту же связь, а
+            # bulk_create(ignore_conflicts=True) молча её пропустит.
+            lock_rows(targets.filter(id__in=ids))
+            linked = dict(
+                targets.filter(id__in=ids).annotate(
+                    linked=Exists(model.objects.filter(
+                        user=user, **{field: OuterRef('pk')}
+                    ))
+                ).values_list('id', 'linked')
+            )
+            results = []
+            created = []
+            for pk in ids:
+                if pk in forbidden:
+                    outcome = 'forbidden'
+                elif pk not in linked:
+                    outcome = 'not_found'
+                elif linked[pk]:
+                    outcome = 'exists'
+                else:
+                    outcome = 'created'
+                    created.append(pk)
+                results.append({'id': pk, 'status': outcome})
+            model.objects.bulk_create(
+                model(user=user, **{f'{field}_id': pk}) for pk in created
+            )
+            change_counter(targets.filter(id__in=created), counter, 1)
+            if on_change is not None:
+                on_change(user.id, created, 1)
+        return Response({'results': results})
+
+    def bulk_delete(self, request, model, field, targets, counter,
+                    on_change=None):
+        """Удаление связей по списку id или всех сразу при all: true."""
+
+        serializer = BulkDeleteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        relations = model.objects.filter(user=request.user)
+        ids = serializer.validated_data.get('ids')
+        if not serializer.validated_data['all']:
+            relations = relations.filter(**{f'{field}_id__in': ids})
+        with transaction.atomic():
+            # Удаляются только заблокированные строки: связь, которую
+            # параллельный запрос удалил раньше, в этот набор не попадёт
+            # и не уменьшит счётчик второй раз.
+            locked = dict(
+                relations.select_for_update().values_list(
+                    'pk', f'{field}_id'
+                )
+            )
+            linked = set(locked.values())
+            deleted, _ = model.objects.filter(pk__in=locked).delete()
+            change_counter(targets.filter(id__in=linked), counter, -1)
+            if on_change is not None:
+                on_change(request.user.id, linked, -1)
+        if serializer.validated_data['all']:
+            return Response({'deleted': deleted})
+        return Response({'results': [
+            {'id': pk, 'status': 'deleted' if pk in linked else 'not_found'}
+            for pk in ids
+        ]})
+
+
+def check_conditions(request, validators, renderer_format):
+    """ETag и Last-Modified ответа и готовый ответ 304, если он подходит.
+
+    validators — пара (состояние, дата изменения или None). ETag
+    строится по адресу запроса, формату ответа и состоянию.
+    """
+
+    state, last_modified = validators
+    digest = md5(
+        f'{request.get_full_path()}|{renderer_format}|{state}'.encode()
+    ).hexdigest()
+    etag = quote_etag(digest)
+    if last_modified is not None:
+        last_modified = int(last_modified.timestamp())
+    return etag, last_modified, get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+
+
+def set_conditional_headers(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+class ConditionalGetMixin:
+    """Ответ 304 на list и retrieve без сериализации.
+
+    list сначала выбирает страницу, затем get_list_validators(page)
+    строит по её строкам состояние списка; retrieve берёт его из
+    get_object_validators. Оба возвращают пару (состояние, дата
+    изменения), полученную без лишних запросов к большим таблицам
+    (см. check_conditions). Дата изменения отдаётся в Last-Modified,
+    если её достаточно для проверки актуальности; иначе вместо неё
+    возвращается None.
+    """
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(
+            self.filter_queryset(self.get_queryset())
+        )
+        return self.conditional_response(
+            self.get_list_validators(page), self.page_response,
+            request, page
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.get_object_validators(), super().retrieve,
+            request, *args, **kwargs
+        )
+
+    def page_response(self, request, page):
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def get_list_validators(self, page):
+        return None
+
+    def get_object_validators(self):
+        return None
+
+    def conditional_response(self, validators, handler, request, *args,
+                             **kwargs):
+        if validators is None:
+            return handler(request, *args, **kwargs)
+
+        etag, last_modified, response = check_conditions(
+            request, validators, request.accepted_renderer.format
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        return set_conditional_headers(response, etag, last_modified)
@@ -1,4 +1,138 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       PageNumberPagination)
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
 
 class CustomPagination(PageNumberPagination):
     page_size_query_param = 'limit'
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Курсорная пагинация рецептов по ключу (pub_date, id).
+
+    Следующая страница выбирается условием по ключу последнего
+    рецепта, поэтому не нужны ни COUNT(*), ни OFFSET.
+    """
+
+    ordering = ('-pub_date', '-id')
+    page_size_query_param = 'limit'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor.reverse
+        position = None
+        if cursor is not None and cursor.position:
+            position = self.decode_position(cursor.position)
+
+        if reverse:
+            queryset = queryset.order_by('pub_date', 'id')
+        else:
+            queryset = queryset.order_by('-pub_date', '-id')
+        if position is not None:
+            pub_date, pk = position
+            if reverse:
+                queryset = queryset.filter(
+                    Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, id__gt=pk)
+                )
+            else:
+                queryset = queryset.filter(
+                    Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=pk)
+                )
+
+        results = list(queryset[:self.page_size + 1])
+        has_following = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next = bool(self.page) and position is not None
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = bool(self.page) and position is not None
+        return self.page
+
+    def encode_position(self, recipe):
+        return f'{recipe.pub_date.isoformat()}|{recipe.pk}'
+
+    def decode_position(self, position):
+        try:
+            pub_date, pk = position.rsplit('|', 1)
+            pub_date = parse_datetime(pub_date)
+            pk = int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if pub_date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return pub_date, pk
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(
+            offset=0,
+            reverse=False,
+            position=self.encode_position(self.page[-1]),
+        ))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(Cursor(
+            offset=0,
+            reverse=True,
+            position=self.encode_position(self.page[0]),
+        ))
+
+
+class RecipePagination(CustomPagination):
+    """Постраничная пагинация с переходом на курсорную по ?cursor=.
+
+    Без параметра cursor ответ остаётся прежним (count, next,
+    previous, results). С ним, в том числе пустым, выдача идёт
+    по курсору и без поля count. Курсор задаёт порядок (pub_date, id),
+    поэтому вместе с search или другим ordering он отклоняется.
+    """
+
+    cursor_pagination_class = RecipeCursorPagination
+    cursor_ordering = '-pub_date'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        params = request.query_params
+        if self.cursor_pagination_class.cursor_query_param in params:
+            ordering = params.get('ordering', self.cursor_ordering)
+            if params.get('search') or ordering != self.cursor_ordering:
+                raise ValidationError({'cursor': (
+                    'Курсор выдаёт рецепты от новых к старым и не '
+                    'совмещается с search и другим ordering.'
+                )})
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_state(self):
+        """Всё, от чего кроме строк страницы зависят count, next и previous.
+
+        В режиме курсора это наличие соседних страниц, без COUNT(*).
+        """
+
+        if self.cursor_paginator is not None:
+            return (
+                self.cursor_paginator.has_next,
+                self.cursor_paginator.has_previous,
+            )
+        return self.page.paginator.count, self.page.number
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -1,5 +1,9 @@
+from hmac import compare_digest
+
 from rest_framework.permissions import SAFE_METHODS, BasePermission
 
+from django.conf import settings
+
 
 class IsAdminOrReadOnly(BasePermission):
     def has_permission(self, request, view):
@@ -14,3 +18,21 @@ class IsAuthorOrReadOnly(BasePermission):
             return True
 
         return obj.user == request.user
+
+
+class CanViewMetrics(BasePermission):
+    """Доступ к метрикам для персонала, по токену или с разрешённых адресов.
+
+    Токен METRICS_TOKEN передаётся в заголовке Authorization: Bearer.
+    Список METRICS_ALLOWED_IPS по умолчанию пуст: за nginx все запросы
+    приходят с 127.0.0.1, и адрес источника ничего не доказывает.
+    """
+
+    def has_permission(self, request, view):
+        if request.user.is_staff:
+            return True
+        token = settings.METRICS_TOKEN
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        if token and compare_digest(header, f'Bearer {token}'):
+            return True
+        return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
@@ -1,21 +1,31 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
 from django.db import transaction
-from django.db.models import F
-from django.shortcuts import get_object_or_404
+from django.db.models import Exists, OuterRef, Prefetch
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
+from recipes import shopping_list
 from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag, ShoppingCard, Favorite
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
-from rest_framework.fields import IntegerField, SerializerMethodField
+from rest_framework.fields import (BooleanField, Field, ImageField,
+                                   IntegerField, ListField,
+                                   SerializerMethodField)
 from rest_framework.relations import PrimaryKeyRelatedField
 from rest_framework import status
-from rest_framework.serializers import ModelSerializer, SerializerMethodField
-from users.models import Subscription, CustomUser
+from rest_framework.serializers import (ListSerializer, ModelSerializer,
+                                        Serializer, SerializerMethodField)
+from users.models import CustomUser, Subscription
 
 
 User = get_user_model()
 
+BULK_MAX_IDS = 100
+PANTRY_MAX_RESULTS = 100
+RECIPE_CACHE_KEY = 'recipe:{pk}:{version}:{base}'
+
 
 class CustomUserCreateSerializer(UserCreateSerializer):
     """Создание пользователя."""
@@ -51,6 +61,8 @@ class CustomUserSerializer(UserSerializer):
     def get_is_subscribed(self, obj):
         """Проверка подписки пользователя."""
 
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         return (
             user.is_authenticated and obj.subscribing.filter(user=user).exists()
@@ -61,7 +73,7 @@ class SubscriptionSerializer(CustomUserSerializer):
     """Подписки пользователя."""
 
     recipes = SerializerMethodField()
-    recipes_count = SerializerMethodField()
+    recipes_count = IntegerField(read_only=True)
 
     class Meta:
         model = CustomUser
@@ -76,36 +88,57 @@ class SubscriptionSerializer(CustomUserSerializer):
             'recipes_count'
         )
 
-    def validate(self, data):
-        author = self.instance
-        user = self.context.get('request').user
-        if Subscription.objects.filter(author=author, user=user).exists():
-            raise ValidationError(
-                detail='Посмотрите внимательно, вы уже на него подписаны!',
-                code=status.HTTP_400_BAD_REQUEST
-            )
-        if user == author:
-            raise ValidationError(
-                detail='Жаль, но вы не можете подписаться на самого себя!',
-                code=status.HTTP_400_BAD_REQUEST
-            )
-        return data
+    def get_recipes(self, obj):
+        """Последние рецепты автора."""
+
+        if hasattr(obj, 'latest_recipes'):
+            queryset = obj.latest_recipes
+        else:
+            queryset = obj.recipes.all()
+            limit = get_recipes_limit(self.context.get('request'))
+            if limit:
+                queryset = queryset[:limit]
+        serializer = RecipeShortSerializer(
+            queryset, many=True, context=self.context
+        )
+        return serializer.data
 
-    def get_recipes_count(self, obj):
-        """Количество рецептов."""
 
-        return Recipe.objects.filter(author=obj.author).count()
+def get_recipes_limit(request):
+    """Значение параметра recipes_limit или None."""
+
+    try:
+        limit = int(request.query_params.get('recipes_limit'))
+    except (TypeError, ValueError):
+        return None
+    return limit if limit > 0 else None
 
-    def get_recipes(self, obj):
-        """Список всех рецептов автора."""
 
+class ImageVariantsField(Field):
+    """Ссылки на уменьшенные копии изображения рецепта.
+
+    Пример: {"thumbnail": {"width": 240, "height": 180,
+    "webp": "...", "jpeg": "..."}, "card": {...}, "full": {...}}.
+    Пока копии не созданы, возвращается пустой словарь.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = 'image_variants'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
         request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        queryset = Recipe.objects.filter(author=obj.author)
-        if limit:
-            queryset = queryset[:int(limit)]
-        serializer = RecipeShortSerializer(queryset, many=True)
-        return serializer.data
+        result = {}
+        for variant, files in value.get('files', {}).items():
+            result[variant] = {}
+            for key, file in files.items():
+                if isinstance(file, str):
+                    file = default_storage.url(file)
+                    if request is not None:
+                        file = request.build_absolute_uri(file)
+                result[variant][key] = file
+        return result
 
 
 class IngredientSerializer(ModelSerializer):
@@ -124,8 +157,132 @@ class TagSerializer(ModelSerializer):
         fields = '__all__'
 
 
+def get_recipe_flags(user):
+    """Выражения Exists для флагов рецепта, зависящих от пользователя."""
+
+    return {
+        'favorited': Exists(
+            Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+        ),
+        'in_cart': Exists(
+            ShoppingCard.objects.filter(user=user, recipe=OuterRef('pk'))
+        ),
+        'subscribed': Exists(
+            Subscription.objects.filter(user=user, author=OuterRef('author'))
+        ),
+    }
+
+
+def represent_recipes(recipes, context):
+    """Представления рецептов из кэша с флагами текущего пользователя.
+
+    Общая для всех часть хранится в кэше под ключом с id и updated_at
+    рецепта, поэтому любое изменение рецепта, его тегов или ингредиентов
+    даёт новый ключ. Флаги is_favorited, is_in_shopping_cart и
+    author.is_subscribed накладываются поверх по одному запросу
+    на весь список.
+    """
+
+    request = context.get('request')
+    user = request.user if request is not None else None
+    return overlay_recipe_flags(
+        recipes,
+        get_shared_representations(recipes, context),
+        get_recipe_flags_map(user, [recipe.pk for recipe in recipes]),
+    )
+
+
+def get_shared_representations(recipes, context):
+    """Общая часть представлений: из кэша или одним запросом с prefetch."""
+
+    request = context.get('request')
+    base = request.build_absolute_uri('/') if request is not None else ''
+    keys = {
+        recipe.pk: RECIPE_CACHE_KEY.format(
+            pk=recipe.pk,
+            version=int(recipe.updated_at.timestamp() * 1000000),
+            base=base,
+        )
+        for recipe in recipes
+    }
+    cached = cache.get_many(keys.values())
+    shared = {
+        pk: cached[key] for pk, key in keys.items() if key in cached
+    }
+    missing = keys.keys() - shared.keys()
+    if not missing:
+        return shared
+
+    shared_context = dict(context, shared=True)
+    fresh = {}
+    for recipe in Recipe.objects.filter(pk__in=missing).select_related(
+        'author'
+    ).prefetch_related(
+        'tags',
+        Prefetch(
+            'ingredient_list',
+            IngredientInRecipe.objects.select_related('ingredient'),
+        ),
+    ):
+        recipe.is_favorited = recipe.is_in_shopping_cart = False
+        recipe.author.is_subscribed = False
+        fresh[recipe.pk] = RecipeReadSerializer(
+            recipe, context=shared_context
+        ).data
+    cache.set_many(
+        {keys[pk]: data for pk, data in fresh.items()},
+        settings.RECIPE_CACHE_TIMEOUT,
+    )
+    shared.update(fresh)
+    return shared
+
+
+def get_recipe_flags_map(user, recipe_ids):
+    """Флаги пользователя для списка рецептов одним запросом."""
+
+    if user is None or not user.is_authenticated or not recipe_ids:
+        return {}
+    return {
+        pk: state
+        for pk, *state in Recipe.objects.filter(pk__in=recipe_ids).annotate(
+            **get_recipe_flags(user)
+        ).values_list('pk', 'favorited', 'in_cart', 'subscribed')
+    }
+
+
+def overlay_recipe_flags(recipes, shared, flags):
+    result = []
+    for recipe in recipes:
+        data = shared.get(recipe.pk)
+        if data is None:
+            continue
+        favorited, in_cart, subscribed = flags.get(
+            recipe.pk, (False, False, False)
+        )
+        result.append(dict(
+            data,
+            author=dict(data['author'], is_subscribed=subscribed),
+            is_favorited=favorited,
+            is_in_shopping_cart=in_cart,
+        ))
+    return result
+
+
+class CachedRecipeListSerializer(ListSerializer):
+    """Список рецептов через represent_recipes."""
+
+    def to_representation(self, data):
+        if self.context.get('shared'):
+            return super().to_representation(data)
+        return represent_recipes(list(data), self.context)
+
+
 class RecipeReadSerializer(ModelSerializer):
-    """Список рецептов."""
+    """Список рецептов.
+
+    Без shared в контексте данные берутся через represent_recipes;
+    с ним сериализуется общая для всех пользователей часть.
+    """
 
     tags = TagSerializer(
         many=True,
@@ -133,7 +290,8 @@ class RecipeReadSerializer(ModelSerializer):
     )
     author = CustomUserSerializer(read_only=True)
     ingredients = SerializerMethodField()
-    image = Base64ImageField()
+    image = ImageField(read_only=True)
+    images = ImageVariantsField()
     is_favorited = SerializerMethodField(read_only=True)
     is_in_shopping_cart = SerializerMethodField(read_only=True)
 
@@ -148,25 +306,35 @@ class RecipeReadSerializer(ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'images',
             'text',
             'cooking_time',
         )
+        list_serializer_class = CachedRecipeListSerializer
+
+    def to_representation(self, instance):
+        if self.context.get('shared'):
+            return super().to_representation(instance)
+        return represent_recipes((instance,), self.context)[0]
 
     def get_ingredients(self, obj):
         """Ингредиенты."""
 
-        recipe = obj
-        ingredients = recipe.ingredients.values(
-            'id',
-            'name',
-            'measurement_unit',
-            amount=F('ingredient_list__amount')
-        )
-        return ingredients
+        return [
+            {
+                'id': item.ingredient.id,
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            }
+            for item in obj.ingredient_list.all()
+        ]
 
     def get_is_favorited(self, obj):
         """Проверка наличия рецепта в избранном."""
 
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
@@ -175,6 +343,8 @@ class RecipeReadSerializer(ModelSerializer):
     def get_is_in_shopping_cart(self, obj):
         """Проверка наличия рецепта в списке покупок."""
 
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
@@ -214,34 +384,21 @@ class RecipeWriteSerializer(ModelSerializer):
             'cooking_time',
         )
 
-    def validate_ingredient(self, value):
-        """Проверка наличия ингредиентов."""
-
-        ingredients = value
-        if not ingredients:
-            raise ValidationError({
-                'ingredients': 'Блюдо не может состоять из воздуха!'
-            })
-
-        for i in ingredients:
-            try:
-                ingredient = get_object_or_404(Ingredient, pk=i['id'])
-            except:
-                raise ValidationError(
-                    detail='Пустой список ингредиентов',
-                    code=status.HTTP_400_BAD_REQUEST
-                )
-            ingredient = ingredients.pop()
-            if ingredient in ingredients:
-                raise ValidationError(
-                    detail='Вы пытаетесь добавить два одинаковых ингредиента!',
-                    code=status.HTTP_400_BAD_REQUEST
-                )
-
-        if int(i['amount']) <= 0:
-            raise ValidationError({
-                'amount': 'Количество ингредиента должно быть больше 0!'
-            })
+    def validate_ingredients(self, value):
+        """Проверка ингредиентов одним запросом к базе."""
+
+        if not value:
+            raise ValidationError('Блюдо не может состоять из воздуха!')
+        ids = [item['id'] for item in value]
+        if len(set(ids)) != len(ids):
+            raise ValidationError(
+                'Вы пытаетесь добавить два одинаковых ингредиента!'
+            )
+        missing = set(ids) - Ingredient.objects.in_bulk(ids).keys()
+        if missing:
+            raise ValidationError(
+                f'Ингредиенты не найдены: {sorted(missing)}'
+            )
         return value
 
     def validate_tags(self, value):
@@ -264,42 +421,77 @@ class RecipeWriteSerializer(ModelSerializer):
         return value
 
     def create_ingredients_amounts(self, ingredients, recipe):
-        """Создание колическво ингредиентов."""
+        """Создание количества ингредиентов."""
 
         IngredientInRecipe.objects.bulk_create(
             [IngredientInRecipe(
-                ingredient=Ingredient.objects.get(id=ingredient['id']),
+                ingredient_id=ingredient['id'],
                 recipe=recipe,
                 amount=ingredient['amount']
             ) for ingredient in ingredients]
         )
 
+    def update_ingredients_amounts(self, ingredients, recipe):
+        """Изменение ингредиентов рецепта по разнице с текущими.
+
+        Та же разница применяется к спискам покупок, где есть рецепт.
+        """
+
+        current = {
+            item.ingredient_id: item for item in recipe.ingredient_list.all()
+        }
+        before = {pk: item.amount for pk, item in current.items()}
+        amounts = {item['id']: item['amount'] for item in ingredients}
+        removed = current.keys() - amounts.keys()
+        if removed:
+            IngredientInRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        changed = []
+        for ingredient_id, item in current.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and amount != item.amount:
+                item.amount = amount
+                changed.append(item)
+        if changed:
+            IngredientInRecipe.objects.bulk_update(changed, ('amount',))
+        self.create_ingredients_amounts(
+            [item for item in ingredients if item['id'] not in current],
+            recipe,
+        )
+        shopping_list.change_recipe_ingredients(recipe.id, before, amounts)
+
+    @transaction.atomic
     def create(self, validated_data):
         """Создание рецепта."""
 
-        tags = self.validate_tags(validated_data.pop('tags'))
-        ingredients = self.validate_ingredient(validated_data.pop('ingredients'))
-        image = self.validate_image(validated_data.pop('image'))
-        recipe = Recipe.objects.create(image=image,**validated_data)
+        tags = validated_data.pop('tags')
+        ingredients = validated_data.pop('ingredients')
+        recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
         self.create_ingredients_amounts(recipe=recipe, ingredients=ingredients)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        """Обновление рецепта."""
+        """Обновление рецепта.
 
-        instance.image = validated_data.get("image", instance.image)
-        instance.name = validated_data.get("name", instance.name)
-        instance.text = validated_data.get("text", instance.text)
-        instance.cooking_time = validated_data.get(
-            "cooking_time", instance.cooking_time
-        )
-        instance.tags.clear()
-        tags_data = self.initial_data.get("tags")
-        instance.tags.set(tags_data)
-        IngredientInRecipe.objects.filter(recipes=instance).all().delete()
-        self.create_ingredients(validated_data.get("ingredients"), instance)
+        Теги и ингредиенты меняются только при их передаче
+        и только в той части, которая отличается от текущей.
+        """
+
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
         instance.save()
+        if tags is not None:
+            instance.tags.set(tags)
+        if ingredients is not None:
+            self.update_ingredients_amounts(ingredients, instance)
+            getattr(instance, '_prefetched_objects_cache', {}).pop(
+                'ingredient_list', None
+            )
         return instance
 
     def to_representation(self, instance):
@@ -310,7 +502,8 @@ class RecipeWriteSerializer(ModelSerializer):
 class RecipeShortSerializer(ModelSerializer):
     """Краткоя информациея о рецепте."""
 
-    image = Base64ImageField()
+    image = ImageField(read_only=True)
+    images = ImageVariantsField()
 
     class Meta:
         model = Recipe
@@ -318,5 +511,51 @@ class RecipeShortSerializer(ModelSerializer):
             'id',
             'name',
             'image',
+            'images',
             'cooking_time'
         )
+
+
+class BulkIdsSerializer(Serializer):
+    """Список id для массового добавления."""
+
+    ids = ListField(
+        child=IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_MAX_IDS,
+    )
+
+    def validate_ids(self, value):
+        return list(dict.fromkeys(value))
+
+
+class BulkDeleteSerializer(BulkIdsSerializer):
+    """Список id для массового удаления или флаг удаления всех связей."""
+
+    ids = ListField(
+        child=IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_MAX_IDS,
+        required=False,
+    )
+    all = BooleanField(default=False)
+
+    def validate(self, data):
+        if not data['all'] and not data.get('ids'):
+            raise ValidationError(
+                'Передайте список ids или all: true.'
+            )
+        return data
+
+
+class PantrySerializer(Serializer):
+    """Параметры подбора рецептов по имеющимся ингредиентам."""
+
+    ingredients = ListField(
+        child=IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_MAX_IDS,
+    )
+    limit = IntegerField(
+        min_value=1, max_value=PANTRY_MAX_RESULTS, default=20
+    )
@@ -1,7 +1,7 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from . import views
+from . import async_views, views
 
 app_name = 'api'
 
@@ -15,6 +15,16 @@ router.register(
     r'ingredients', views.IngredientViewSet, basename='ingredients')
 
 urlpatterns = [
+    path('metrics', views.MetricsView.as_view(), name='metrics'),
+    path('async/recipes/', async_views.recipe_list,
+         name='async-recipes-list'),
+    path('async/recipes/<int:pk>/', async_views.recipe_detail,
+         name='async-recipes-detail'),
+    path('async/tags/', async_views.tag_list, name='async-tags-list'),
+    path('async/ingredients/', async_views.ingredient_list,
+         name='async-ingredients-list'),
+    path('async/users/subscriptions/', async_views.subscriptions,
+         name='async-users-subscriptions'),
     path('', include(router.urls)),
     path('', include('djoser.urls')),
     path(r'auth/', include('djoser.urls.authtoken')),
@@ -1,11 +1,18 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import IntegrityError, transaction
+from django.db.models import (BooleanField, Count, F, Max, OuterRef,
+                              Prefetch, Subquery, Value, Window)
+from django.db.models.functions import RowNumber
+from django.http import HttpResponse, StreamingHttpResponse
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter
+from foodgram.metrics import render_metrics
+from recipes import shopping_list
+from recipes.counters import change_counter, lock_rows
 from recipes.models import (Ingredient, IngredientInRecipe, Recipe,
-                            ShoppingCard, Tag, Favorite)
+                            ShoppingCard, ShoppingListItem, Tag, Favorite)
+from recipes.search import ingredient_index, pantry_index
 from users.models import Subscription
 
 from rest_framework import status
@@ -14,11 +21,20 @@ from rest_framework.decorators import action
 from rest_framework.permissions import SAFE_METHODS, IsAuthenticated, IsAuthenticatedOrReadOnly, AllowAny
 from rest_framework.response import Response
 from rest_framework.status import HTTP_400_BAD_REQUEST
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
 from .filters import RecipeFilter
-from .pagination import CustomPagination
-from .permissions import IsAdminOrReadOnly, IsAuthorOrReadOnly
+from .mixins import (BulkRelationMixin, ConditionalGetMixin,
+                     ReferenceCacheMixin)
+from .pagination import CustomPagination, RecipePagination
+from .permissions import (CanViewMetrics, IsAdminOrReadOnly,
+                          IsAuthorOrReadOnly)
+from .renderers import (
+    CSVShoppingListRenderer,
+    PDFShoppingListRenderer,
+    TextShoppingListRenderer,
+)
 from .serializers import (
     IngredientSerializer,
     TagSerializer,
@@ -27,43 +43,187 @@ from .serializers import (
     RecipeWriteSerializer,
     RecipeShortSerializer,
     CustomUserSerializer,
+    PantrySerializer,
     SubscriptionSerializer,
+    get_recipe_flags,
+    get_recipes_limit,
 )
 
 User = get_user_model()
 
+SHOPPING_LIST_CHUNK_SIZE = 500
+
+
+def attach_latest_recipes(authors, limit):
+    """Последние рецепты всех авторов страницы одним запросом.
+
+    Рецепты нумеруются внутри каждого автора оконной функцией
+    ROW_NUMBER() и отбираются первые limit штук.
+    """
+
+    authors = {author.id: author for author in authors}
+    for author in authors.values():
+        author.latest_recipes = []
+    if not authors:
+        return
+    ranked = Recipe.objects.filter(author_id__in=authors).annotate(
+        row_number=Window(
+            expression=RowNumber(),
+            partition_by=[F('author_id')],
+            order_by=[F('pub_date').desc(), F('id').desc()],
+        )
+    ).values(
+        'id', 'author_id', 'name', 'image', 'image_variants',
+        'cooking_time', 'pub_date', 'row_number'
+    )
+    sql, params = ranked.query.sql_with_params()
+    sql = f'SELECT * FROM ({sql}) ranked'
+    if limit:
+        sql = f'{sql} WHERE ranked.row_number <= %s'
+        params = (*params, limit)
+    recipes = Recipe.objects.raw(
+        f'{sql} ORDER BY ranked.author_id, ranked.row_number', params
+    )
+    for recipe in recipes:
+        authors[recipe.author_id].latest_recipes.append(recipe)
+
+
+def get_relations_state(user):
+    """Число и последний id избранного, покупок и подписок пользователя.
+
+    Добавление или удаление любой связи меняет хотя бы одно значение.
+    Подзапросы читают только строки пользователя по индексам
+    (user, recipe) и (user, author).
+    """
+
+    aggregates = {}
+    for name, model in (
+        ('favorites', Favorite),
+        ('cart', ShoppingCard),
+        ('subscriptions', Subscription),
+    ):
+        rows = model.objects.filter(
+            user=OuterRef('pk')
+        ).order_by().values('user')
+        aggregates[f'{name}_count'] = Subquery(
+            rows.annotate(value=Count('id')).values('value')
+        )
+        aggregates[f'{name}_last'] = Subquery(
+            rows.annotate(value=Max('id')).values('value')
+        )
+    return User.objects.filter(pk=user.pk).annotate(
+        **aggregates
+    ).values_list(*aggregates).first()
+
 
-class CustomUserViewSet(UserViewSet):
+def get_recipe_list_validators(paginator, page, user):
+    """id и даты изменения рецептов страницы и состояние пагинации.
+
+    Для пользователя к ним добавляется состояние его избранного,
+    списка покупок и подписок (get_relations_state), поэтому
+    добавление в избранное тоже меняет ETag. Last-Modified не
+    отдаётся: удаление рецепта или изменение связей не сдвигает
+    последнюю дату изменения, и клиент с If-Modified-Since получил
+    бы устаревший список.
+    """
+
+    state = (
+        paginator.get_state(),
+        [(recipe.pk, recipe.updated_at.timestamp()) for recipe in page],
+    )
+    if user.is_authenticated:
+        return f'{user.pk}|{state}|{get_relations_state(user)}', None
+    return f'{state}', None
+
+
+def get_recipe_validators(pk, user):
+    """Дата изменения рецепта и флаги пользователя; None, если его нет."""
+
+    queryset = Recipe.objects.filter(pk=pk)
+    if user.is_authenticated:
+        queryset = queryset.annotate(**get_recipe_flags(user))
+        state = queryset.values_list(
+            'updated_at', 'favorited', 'in_cart', 'subscribed'
+        ).first()
+    else:
+        state = queryset.values_list('updated_at').first()
+    if state is None:
+        return None
+    if user.is_authenticated:
+        return f'{user.pk}|{state}', None
+    return f'{state}', state[0]
+
+
+class CustomUserViewSet(BulkRelationMixin, UserViewSet):
     """ViewSet пользователя."""
 
     queryset = User.objects.all()
     serializer_class = CustomUserSerializer
     pagination_class = CustomPagination
+    replica_actions = ('list',)
 #    permission_classes = (IsAuthenticatedOrReadOnly,)
 
     @action(
         detail=True,
         methods=['post', 'delete'],
-#        permission_classes=(IsAuthenticated,)
+        permission_classes=(IsAuthenticated,)
     )
     def subscribe(self, request, **kwargs):
         """Создание/удаление подписки на автора."""
 
+        if request.method == 'DELETE':
+            with transaction.atomic():
+                deleted, _ = Subscription.objects.filter(
+                    user=request.user, author_id=kwargs['id']
+                ).delete()
+                if deleted:
+                    change_counter(
+                        User.objects.filter(id=kwargs['id']),
+                        'subscribers_count', -1
+                    )
+            if deleted:
+                return Response(status=status.HTTP_204_NO_CONTENT)
+            get_object_or_404(User, id=kwargs['id'])
+            return Response({'errors': 'Вы не подписаны на этого автора.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
         author = get_object_or_404(User, id=kwargs['id'])
+        if author == request.user:
+            return Response(
+                {'errors': 'Жаль, но вы не можете подписаться на самого себя!'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            with transaction.atomic():
+                lock_rows(User.objects.filter(id=author.id))
+                Subscription.objects.create(user=request.user, author=author)
+                change_counter(
+                    User.objects.filter(id=author.id), 'subscribers_count', 1
+                )
+        except IntegrityError:
+            return Response(
+                {'errors': 'Посмотрите внимательно, вы уже на него подписаны!'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        author.is_subscribed = True
+        author.subscribers_count += 1
+        serializer = SubscriptionSerializer(
+            author, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        if request.method == 'POST':
-            serializer = SubscriptionSerializer(
-                author, data=request.data, context={'request': request})
-            serializer.is_valid(raise_exception=True)
-#            serializer.is_valid(raise_exception=False)
-            Subscription.objects.create(user=request.user, author=author)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='subscribe/bulk',
+        permission_classes=(IsAuthenticated,)
+    )
+    def subscribe_bulk(self, request):
+        """Создание/удаление подписок на список авторов."""
 
-        if request.method == 'DELETE':
-            get_object_or_404(
-                Subscription, user=request.user, author=author).delete()
-            return Response({'detail': 'Успешная отписка'},
-                            status=status.HTTP_204_NO_CONTENT)
+        return self.bulk_relation(
+            request, Subscription, 'author', User.objects.all(),
+            'subscribers_count', forbidden={request.user.id},
+        )
 
     @action(
         detail=False,
@@ -72,43 +232,101 @@ class CustomUserViewSet(UserViewSet):
     def subscriptions(self, request):
         """Просмотр подписок пользователя."""
 
-        queryset = User.objects.filter(subscribing__user=request.user)
+        queryset = User.objects.filter(
+            subscribing__user=request.user
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField()),
+        ).order_by('id')
         pages = self.paginate_queryset(queryset)
+        attach_latest_recipes(pages, get_recipes_limit(request))
         serializer = SubscriptionSerializer(
             pages, many=True, context={'request': request})
         return self.get_paginated_response(serializer.data)
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+class TagViewSet(ReferenceCacheMixin, ReadOnlyModelViewSet):
     """Получение информации о тегах."""
 
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
+    cache_namespace = 'tags'
+    replica_actions = ('list', 'retrieve')
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(ReferenceCacheMixin, ReadOnlyModelViewSet):
     """Получение информации об ингредиентах."""
 
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (SearchFilter,)
-    search_fields = ('name',)
     pagination_class = None
+    cache_namespace = 'ingredients'
+    replica_actions = ('list', 'retrieve')
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return Response(
+                ingredient_index.search(name, settings.INGREDIENT_SEARCH_LIMIT)
+            )
+        return super().list(request, *args, **kwargs)
 
 
-class RecipeViewSet(ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, BulkRelationMixin, ModelViewSet):
     """Для работы с рецептами"""
 
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthenticatedOrReadOnly,)
-    pagination_class = CustomPagination
+    pagination_class = RecipePagination
     filter_backends = (DjangoFilterBackend, )
     filterset_class = RecipeFilter
+    replica_actions = (
+        'list', 'retrieve', 'pantry', 'shopping_list',
+        'download_shopping_card',
+    )
     http_method_names = ['get', 'post', 'patch', 'create', 'delete']
 
+    def get_queryset(self):
+        """Рецепты для чтения и для изменения.
+
+        При чтении нужны только ключевые поля: представление берётся
+        из кэша (см. represent_recipes). При изменении заранее загружаются
+        ингредиенты, с которыми сравнивается новый список.
+        """
+
+        if self.action in ('list', 'retrieve'):
+            return Recipe.objects.only('id', 'pub_date', 'updated_at')
+        return Recipe.objects.prefetch_related(
+            Prefetch(
+                'ingredient_list',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'
+                )
+            ),
+        )
+
+    def get_list_validators(self, page):
+        return get_recipe_list_validators(
+            self.paginator, page, self.request.user
+        )
+
+    def get_object_validators(self):
+        return get_recipe_validators(self.kwargs['pk'], self.request.user)
+
+    @transaction.atomic
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
+        change_counter(
+            User.objects.filter(id=self.request.user.id), 'recipes_count', 1
+        )
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        author_id = instance.author_id
+        instance.delete()
+        change_counter(
+            User.objects.filter(id=author_id), 'recipes_count', -1
+        )
 
     def get_serializer_class(self):
 
@@ -121,103 +339,212 @@ class RecipeViewSet(ModelViewSet):
         methods=['post', 'delete'],
         permission_classes=(IsAuthenticated,)
     )
-    def favorite(self, request, **kwargs):
-        recipe = get_object_or_404(Recipe, id=kwargs['id'])
+    def favorite(self, request, pk=None):
+        """Добавление/удаление рецепта в избранном."""
 
         if request.method == 'POST':
-            serializer = RecipeShortSerializer(recipe, data=request.data,
-                                          context={"request": request})
-            serializer.is_valid(raise_exception=True)
-            if not Favorite.objects.filter(user=request.user,
-                                           recipe=recipe).exists():
-                Favorite.objects.create(user=request.user, recipe=recipe)
-                return Response(serializer.data,
-                                status=status.HTTP_201_CREATED)
-            return Response({'errors': 'Рецепт уже в избранном.'},
-                            status=status.HTTP_400_BAD_REQUEST)
+            return self.add_to(Favorite, request.user, pk,
+                               'Рецепт уже в избранном.',
+                               'favorites_count')
+        return self.delete_from(Favorite, request.user, pk,
+                                'Рецепта нет в избранном.',
+                                'favorites_count')
 
-        if request.method == 'DELETE':
-            get_object_or_404(Favorite, user=request.user,
-                              recipe=recipe).delete()
-            return Response({'detail': 'Рецепт успешно удален из избранного.'},
-                            status=status.HTTP_204_NO_CONTENT)
     @action(
         detail=True,
         methods=['post', 'delete'],
         permission_classes=(IsAuthenticated,)
     )
-    def shopping_card(self, request, **kwargs):
-        recipe = get_object_or_404(Recipe, id=kwargs['id'])
+    def shopping_card(self, request, pk=None):
+        """Добавление/удаление рецепта в списке покупок."""
 
         if request.method == 'POST':
-            serializer = RecipeShortSerializer(recipe, data=request.data,
-                                          context={"request": request})
-            serializer.is_valid(raise_exception=True)
-            if not ShoppingCard.objects.filter(user=request.user,
-                                                recipe=recipe).exists():
-                ShoppingCard.objects.create(user=request.user, recipe=recipe)
-                return Response(serializer.data,
-                                status=status.HTTP_201_CREATED)
-            return Response({'errors': 'Рецепт уже в списке покупок.'},
-                            status=status.HTTP_400_BAD_REQUEST)
+            return self.add_to(ShoppingCard, request.user, pk,
+                               'Рецепт уже в списке покупок.',
+                               'in_carts_count', shopping_list.change_recipes)
+        return self.delete_from(ShoppingCard, request.user, pk,
+                                'Рецепта нет в списке покупок.',
+                                'in_carts_count', shopping_list.change_recipes)
 
-        if request.method == 'DELETE':
-            get_object_or_404(Shopping_cart, user=request.user,
-                              recipe=recipe).delete()
-            return Response(
-                {'detail': 'Рецепт успешно удален из списка покупок.'},
-                status=status.HTTP_204_NO_CONTENT
-            )
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='favorite/bulk',
+        permission_classes=(IsAuthenticated,)
+    )
+    def favorite_bulk(self, request):
+        """Добавление/удаление списка рецептов в избранном."""
+
+        return self.bulk_relation(
+            request, Favorite, 'recipe', Recipe.objects.all(),
+            'favorites_count',
+        )
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='shopping_card/bulk',
+        permission_classes=(IsAuthenticated,)
+    )
+    def shopping_card_bulk(self, request):
+        """Добавление/удаление списка рецептов в списке покупок."""
+
+        return self.bulk_relation(
+            request, ShoppingCard, 'recipe', Recipe.objects.all(),
+            'in_carts_count', on_change=shopping_list.change_recipes,
+        )
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=(AllowAny,)
+    )
+    def pantry(self, request):
+        """Что приготовить из имеющихся ингредиентов.
+
+        Рецепты ранжируются по доле своих ингредиентов, найденных
+        в наборе, и возвращаются вместе с недостающими.
+        """
+
+        serializer = PantrySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        ingredient_ids = serializer.validated_data['ingredients']
+        limit = serializer.validated_data['limit']
+        ranked = pantry_index.rank(ingredient_ids, limit)
+        recipes = Recipe.objects.in_bulk([row[0] for row in ranked])
+        stale = [row[0] for row in ranked if row[0] not in recipes]
+        if stale:
+            pantry_index.remove_recipes(stale)
+            ranked = [row for row in ranked if row[0] in recipes]
+        missing = Ingredient.objects.in_bulk(
+            {pk for row in ranked for pk in row[2]}
+        )
+        context = self.get_serializer_context()
+        return Response([
+            {
+                'recipe': RecipeShortSerializer(
+                    recipes[recipe_id], context=context
+                ).data,
+                'coverage': round(coverage, 3),
+                'missing': IngredientSerializer(
+                    [missing[pk] for pk in missing_ids], many=True
+                ).data,
+            }
+            for recipe_id, coverage, missing_ids in ranked
+        ])
+
+    def add_to(self, model, user, id, error, counter, on_change=None):
+        """Добавление связи одним INSERT.
+
+        Повторное добавление отсекает уникальное ограничение (user, recipe),
+        поэтому двойной клик не создаст дубликат. Строка рецепта
+        блокируется, как и в массовом добавлении (lock_rows). Счётчик
+        рецепта и зависящие от связи данные (on_change) меняются в той
+        же транзакции.
+        """
 
-    def add_to(self, model, user, id):
-        if model.objects.filter(user=user, recipe__id=id).exists():
-            return Response({'errors': 'Рецепт уже добавлен!'}, status=status.HTTP_400_BAD_REQUEST)
         recipe = get_object_or_404(Recipe, id=id)
-        model.objects.create(user=user, recipe=recipe)
-        serializer = RecipeShortSerializer(recipe)
+        try:
+            with transaction.atomic():
+                lock_rows(Recipe.objects.filter(id=id))
+                model.objects.create(user=user, recipe=recipe)
+                change_counter(Recipe.objects.filter(id=id), counter, 1)
+                if on_change is not None:
+                    on_change(user.id, [recipe.id], 1)
+        except IntegrityError:
+            return Response({'errors': error},
+                            status=status.HTTP_400_BAD_REQUEST)
+        serializer = RecipeShortSerializer(
+            recipe, context={'request': self.request}
+        )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-    def delete_from(self, model, user, id):
-        obj = model.objects.filter(user=user, recipe__id=id)
-        if obj.exists():
-            obj.delete()
+    def delete_from(self, model, user, id, error, counter, on_change=None):
+        """Удаление связи одним DELETE по числу удалённых строк."""
+
+        with transaction.atomic():
+            deleted, _ = model.objects.filter(
+                user=user, recipe_id=id
+            ).delete()
+            if deleted:
+                change_counter(Recipe.objects.filter(id=id), counter, -1)
+                if on_change is not None:
+                    on_change(user.id, [id], -1)
+        if deleted:
             return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response({'errors': 'Рецепт уже удален!'}, status=status.HTTP_400_BAD_REQUEST)
+        get_object_or_404(Recipe, id=id)
+        return Response({'errors': error},
+                        status=status.HTTP_400_BAD_REQUEST)
 
     @action(
         detail=False,
         methods=['get'],
         permission_classes=(IsAuthenticated,)
     )
-    def download_shopping_card(self, request):
-        if not request.user.shopping_cart.exists():
-            return Response(status=HTTP_400_BAD_REQUEST)
+    def shopping_list(self, request):
+        """Текущий список покупок: ингредиенты и их количество."""
 
-        shopping_cart_result = {}
-        ingredients = IngredientInRecipe.objects.filter(
-            recipe__shopping_cart__user=request.user
+        items = ShoppingListItem.objects.filter(
+            user=request.user
         ).values_list(
-            'ingredients__name',
-            'ingredients__measurement_unit',
-            'amount'
-        )
+            'ingredient_id',
+            'ingredient__name',
+            'ingredient__measurement_unit',
+            'total_amount',
+        ).order_by('ingredient__name')
+        return Response([
+            {
+                'id': pk,
+                'name': name,
+                'measurement_unit': measurement_unit,
+                'amount': amount,
+            }
+            for pk, name, measurement_unit, amount in items
+        ])
 
-        for ingredient in ingredients:
-            name = ingredient[0]
-            if name not in shopping_cart_result:
-                shopping_cart_result[name] = {
-                    'measurement_unit': ingredient[1],
-                    'amount': ingredient[2],
-                }
-            else:
-                shopping_cart_result[name]['amount'] += ingredient[2]
-
-        shopping_cart_itog = (
-            f'{name} - {value("amount")} ' f'{value("measurement_unit")}\n'
-            for name, value in shopping_cart_result.items()
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(
+            TextShoppingListRenderer,
+            CSVShoppingListRenderer,
+            PDFShoppingListRenderer,
         )
+    )
+    def download_shopping_card(self, request):
+        """Выгрузка списка покупок в формате txt, csv или pdf."""
+
+        ingredients = ShoppingListItem.objects.filter(
+            user=request.user
+        ).values(
+            'ingredient__name',
+            'ingredient__measurement_unit',
+            amount=F('total_amount'),
+        ).order_by('ingredient__name')
+        if not ingredients.exists():
+            return Response(status=HTTP_400_BAD_REQUEST)
 
-        filename = f'{user.username}_shoppingcard.txt'
-        response = HttpResponse(shopping_cart_itog, content_type='text/plain')
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        response = StreamingHttpResponse(
+            renderer.stream(
+                ingredients.iterator(chunk_size=SHOPPING_LIST_CHUNK_SIZE)
+            ),
+            content_type=content_type
+        )
+        filename = f'{request.user.username}_shoppingcard.{renderer.format}'
         response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
+
+
+class MetricsView(APIView):
+    """Метрики приложения в текстовом формате Prometheus."""
+
+    permission_classes = (CanViewMetrics,)
+
+    def get(self, request):
+        content, content_type = render_metrics()
+        return HttpResponse(content, content_type=content_type)
@@ -0,0 +1,61 @@
+from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+
+def get_estimated_count(model, using):
+    """Оценка числа строк таблицы по статистике PostgreSQL.
+
+    Возвращает None для других СУБД и для таблиц без статистики.
+    """
+
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+            (model._meta.db_table,),
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator, не считающий точно строки большой таблицы.
+
+    COUNT(*) в PostgreSQL читает таблицу целиком. Для списка без
+    фильтров и поиска берётся оценка планировщика, если она не меньше
+    ESTIMATED_COUNT_THRESHOLD; в остальных случаях число строк
+    считается как обычно.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if (
+            isinstance(queryset, QuerySet)
+            and not queryset.query.where
+            and not queryset.query.distinct
+        ):
+            estimate = get_estimated_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Основа админки для таблиц, растущих вместе с числом пользователей.
+
+    Кроме оценки общего числа строк, при фильтрации не выполняется
+    второй COUNT(*) по всей таблице.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -5,3 +5,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
 application = get_asgi_application()
+
+from recipes.search import warm_up_ingredient_index  # noqa: E402
+
+warm_up_ingredient_index()
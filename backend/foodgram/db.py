@@ -0,0 +1,131 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_started
+from django.db import connections
+from django.dispatch import receiver
+
+REPLICA = 'replica'
+STICKY_KEY = 'db:sticky:{client}'
+
+# Модели, которые всегда читаются с основной базы: токен, полученный
+# только что, может ещё не дойти до реплики.
+PRIMARY_MODELS = {'authtoken.token', 'sessions.session'}
+
+current_database = ContextVar('current_database', default=None)
+
+
+class ReplicaRouter:
+    """Чтение с реплики для запросов, помеченных ReplicaRoutingMiddleware.
+
+    Запись и любые чтения вне таких запросов идут в основную базу.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower in PRIMARY_MODELS:
+            return 'default'
+        return current_database.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == REPLICA:
+            return False
+        return None
+
+
+class CounterFieldsMixin:
+    """Счётчики модели, которые меняются только UPDATE с F().
+
+    save() существующего объекта не записывает поля counter_fields,
+    если они не названы в update_fields явно: иначе значения,
+    прочитанные до параллельного изменения счётчика, затёрли бы его.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (
+            not args
+            and not self._state.adding
+            and not kwargs.get('force_insert')
+            and kwargs.get('update_fields') is None
+        ):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+@contextmanager
+def use_primary():
+    """Чтение с основной базы внутри запроса, идущего на реплику."""
+
+    token = current_database.set(None)
+    try:
+        yield
+    finally:
+        current_database.reset(token)
+
+
+def get_client_key(request):
+    """Ключ клиента для привязки к основной базе после записи.
+
+    Берётся из заголовка Authorization или сессионной cookie, поэтому
+    известен ещё до аутентификации DRF внутри view.
+    """
+
+    credentials = request.META.get('HTTP_AUTHORIZATION') or (
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    if not credentials:
+        return None
+    return md5(credentials.encode()).hexdigest()
+
+
+def is_sticky(request):
+    client = get_client_key(request)
+    return client is not None and bool(
+        cache.get(STICKY_KEY.format(client=client))
+    )
+
+
+def make_sticky(request):
+    """Чтения клиента идут в основную базу DATABASE_REPLICA_STICKY_SECONDS.
+
+    Отметка хранится в кэше Django, поэтому между процессами gunicorn
+    она действует только с общим кэшем (CACHE_BACKEND).
+    """
+
+    client = get_client_key(request)
+    if client is not None:
+        cache.set(
+            STICKY_KEY.format(client=client),
+            True,
+            settings.DATABASE_REPLICA_STICKY_SECONDS,
+        )
+
+
+@receiver(request_started)
+def check_connections(**kwargs):
+    """Проверка постоянных подключений перед обработкой запроса.
+
+    При CONN_MAX_AGE подключение переживает запрос, и сервер базы
+    мог уже закрыть его. Неработающее подключение закрывается, и
+    Django откроет новое при первом запросе к базе.
+    """
+
+    if not settings.DATABASE_HEALTH_CHECKS:
+        return
+    for connection in connections.all():
+        if connection.connection is not None and not connection.is_usable():
+            connection.close()
@@ -0,0 +1,61 @@
+import os
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+
+requests_total = Counter(
+    'foodgram_requests_total',
+    'Количество HTTP-запросов.',
+    ('view', 'action', 'method', 'status'),
+)
+request_latency = Histogram(
+    'foodgram_request_duration_seconds',
+    'Время обработки запроса.',
+    ('view', 'action'),
+    buckets=LATENCY_BUCKETS,
+)
+request_queries = Histogram(
+    'foodgram_request_db_queries',
+    'Количество SQL-запросов на один HTTP-запрос.',
+    ('view', 'action'),
+    buckets=QUERY_BUCKETS,
+)
+cache_requests_total = Counter(
+    'foodgram_cache_requests_total',
+    'Обращения к кэшу; доля попаданий — hit / (hit + miss).',
+    ('cache', 'result'),
+)
+
+
+def get_view_labels(request):
+    """Имя ViewSet и action, например ('RecipeViewSet', 'favorite')."""
+
+    match = request.resolver_match
+    if match is None:
+        return 'unmatched', ''
+    view = getattr(match.func, 'cls', None)
+    if view is None:
+        return match.view_name or match.func.__name__, ''
+    actions = getattr(match.func, 'actions', None) or {}
+    return view.__name__, actions.get(request.method.lower(), '')
+
+
+def render_metrics():
+    """Метрики в текстовом формате Prometheus.
+
+    Если задан PROMETHEUS_MULTIPROC_DIR, значения собираются из
+    mmap-файлов всех процессов gunicorn, иначе — из текущего процесса.
+    """
+
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,231 @@
+import json
+import logging
+import random
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from rest_framework.permissions import SAFE_METHODS
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from foodgram.db import REPLICA, current_database, is_sticky, make_sticky
+from foodgram.metrics import (get_view_labels, request_latency,
+                              request_queries, requests_total)
+
+logger = logging.getLogger('foodgram.timing')
+
+current_timings = ContextVar('current_timings', default=None)
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    """Учёт SQL-запросов на каждом новом подключении к базе.
+
+    Замеры пишутся в RequestTimings текущего запроса из contextvar,
+    поэтому учитываются и запросы, выполненные в других потоках
+    через sync_to_async из асинхронных view. Объект подключения
+    потока переживает переподключения, поэтому обёртка ставится
+    на него один раз.
+    """
+
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def record_query(execute, sql, params, many, context):
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add_query(perf_counter() - started)
+
+
+class RequestTimings:
+    """Время обработки одного запроса по этапам."""
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.render = 0.0
+        self.render_started = None
+        self.total = 0.0
+        self._lock = Lock()
+
+    def add_query(self, duration):
+        with self._lock:
+            self.db += duration
+            self.queries += 1
+
+    @property
+    def serialize(self):
+        """Время во view за вычетом SQL и рендеринга.
+
+        Для DRF это в основном работа сериализаторов. У асинхронных
+        view запросы идут параллельно, и их суммарное время может
+        превысить общее.
+        """
+
+        return max(self.total - self.db - self.render, 0.0)
+
+    def as_header(self):
+        return ', '.join((
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries"',
+            f'serialize;dur={self.serialize * 1000:.1f};desc="view"',
+            f'render;dur={self.render * 1000:.1f}',
+            f'total;dur={self.total * 1000:.1f}',
+        ))
+
+
+class AsyncCapableMiddleware:
+    """Основа middleware, работающего и под WSGI, и под ASGI.
+
+    Под ASGI синхронный middleware заставил бы Django выполнять
+    каждый запрос через единственный поток sync_to_async.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        self.before(request)
+        return self.after(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        self.before(request)
+        return self.after(request, await self.get_response(request))
+
+    def before(self, request):
+        pass
+
+    def after(self, request, response):
+        return response
+
+
+class RequestTimingMiddleware(AsyncCapableMiddleware):
+    """Подсчёт SQL-запросов и времени этапов запроса.
+
+    Результат отдаётся в заголовке Server-Timing и, для доли запросов
+    REQUEST_TIMING_LOG_SAMPLE_RATE, пишется в лог одной JSON-строкой.
+    Отключается настройкой REQUEST_TIMING_ENABLED.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING_ENABLED:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.sample_rate = settings.REQUEST_TIMING_LOG_SAMPLE_RATE
+
+    def before(self, request):
+        request.timings = RequestTimings()
+        request.timings_token = current_timings.set(request.timings)
+
+    def after(self, request, response):
+        current_timings.reset(request.timings_token)
+        timings = request.timings
+        timings.total = perf_counter() - timings.started
+        response['Server-Timing'] = timings.as_header()
+        if self.sample_rate and random.random() < self.sample_rate:
+            self.log(request, response, timings)
+        return response
+
+    def process_template_response(self, request, response):
+        timings = request.timings
+        timings.render_started = perf_counter()
+
+        def stop(response):
+            timings.render += perf_counter() - timings.render_started
+
+        response.add_post_render_callback(stop)
+        return response
+
+    def log(self, request, response, timings):
+        match = request.resolver_match
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'queries': timings.queries,
+            'db_ms': round(timings.db * 1000, 2),
+            'serialize_ms': round(timings.serialize * 1000, 2),
+            'render_ms': round(timings.render * 1000, 2),
+            'total_ms': round(timings.total * 1000, 2),
+        }))
+
+
+class MetricsMiddleware(AsyncCapableMiddleware):
+    """Счётчики и гистограммы запросов для /api/metrics.
+
+    Метки — имя ViewSet и action. Число SQL-запросов берётся из
+    RequestTimingMiddleware, поэтому этот middleware ставится перед ним.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def before(self, request):
+        request.metrics_started = perf_counter()
+
+    def after(self, request, response):
+        elapsed = perf_counter() - request.metrics_started
+        view, action = get_view_labels(request)
+        requests_total.labels(
+            view, action, request.method, response.status_code
+        ).inc()
+        request_latency.labels(view, action).observe(elapsed)
+        timings = getattr(request, 'timings', None)
+        if timings is not None:
+            request_queries.labels(view, action).observe(timings.queries)
+        return response
+
+
+class ReplicaRoutingMiddleware(AsyncCapableMiddleware):
+    """Чтение с реплики для безопасных запросов к отмеченным ViewSet.
+
+    ViewSet перечисляет в replica_actions действия, которые можно
+    читать с реплики. После успешного изменяющего запроса клиент
+    на DATABASE_REPLICA_STICKY_SECONDS привязывается к основной базе,
+    чтобы сразу видеть свои изменения. Без базы replica в DATABASES
+    middleware отключается.
+    """
+
+    def __init__(self, get_response):
+        if REPLICA not in settings.DATABASES:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, 'cls', None)
+        actions = getattr(view_func, 'actions', None) or {}
+        if (
+            request.method in SAFE_METHODS
+            and actions.get(request.method.lower()) in getattr(
+                view, 'replica_actions', ()
+            )
+            and not is_sticky(request)
+        ):
+            current_database.set(REPLICA)
+
+    def after(self, request, response):
+        current_database.set(None)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            make_sticky(request)
+        return response
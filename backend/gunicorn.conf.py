@@ -0,0 +1,24 @@
+"""Настройки gunicorn; файл подхватывается из рабочего каталога.
+
+В режиме нескольких процессов prometheus_client хранит метрики
+в mmap-файлах каталога PROMETHEUS_MULTIPROC_DIR. Файлы прошлого
+запуска искажают счётчики, а файлы завершившихся воркеров — значения
+gauge, поэтому каталог очищается при старте, а умерший воркер
+помечается в child_exit.
+"""
+import os
+import shutil
+
+from prometheus_client import multiprocess
+
+
+def on_starting(server):
+    directory = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(worker.pid)
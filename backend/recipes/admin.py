@@ -1,13 +1,14 @@
 from django.contrib import admin
 from django.contrib.admin import display
-from recipes.models import (
-    Ingredient,
-    IngredientInRecipe,
-    Recipe,
-    Favorite,
-    ShoppingCard,
-    Tag
-)
+from django.contrib.auth import get_user_model
+
+from foodgram.admin import LargeTableAdmin
+from recipes import shopping_list
+from recipes.counters import recount_by_ids, recount_recipes, recount_users
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCard, Tag)
+
+User = get_user_model()
 
 
 class TagAdmin(admin.ModelAdmin):
@@ -18,34 +19,177 @@ class TagAdmin(admin.ModelAdmin):
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'measurement_unit')
     list_editable = ('name', 'measurement_unit')
-    list_filter = ('name',)
+    list_filter = ('measurement_unit',)
     search_fields = ('name', )
 
 
-class RecipeAdmin(admin.ModelAdmin):
+class IngredientInRecipeInline(admin.TabularInline):
+    model = IngredientInRecipe
+    autocomplete_fields = ('ingredient',)
+    extra = 1
+    min_num = 1
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('ingredient')
+
+
+class RecipeAdmin(LargeTableAdmin):
     list_display = ('id', 'name', 'author', 'count_favorited', 'cooking_time')
-    list_editable = ('name', 'author')
-    list_filter = ('name', 'author', 'tags')
+    list_editable = ('name',)
+    list_filter = ('tags',)
+    search_fields = ('name', 'author__username', 'author__email')
+    autocomplete_fields = ('author',)
     readonly_fields = ('count_favorited',)
+    inlines = (IngredientInRecipeInline,)
 
-    @display(description='Количество в избранных')
+    @display(description='Количество в избранных',
+             ordering='favorites_count')
     def count_favorited(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('author')
 
-class ShoppingListAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'recipe')
-    list_editable = ('user', 'recipe')
+    def save_model(self, request, obj, form, change):
+        author_ids = {obj.author_id}
+        if change:
+            author_ids.add(Recipe.objects.get(pk=obj.pk).author_id)
+        super().save_model(request, obj, form, change)
+        recount_by_ids(User, author_ids, recount_users)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        recount_by_ids(User, {obj.author_id}, recount_users)
 
+    def delete_queryset(self, request, queryset):
+        author_ids = set(queryset.values_list('author_id', flat=True))
+        super().delete_queryset(request, queryset)
+        recount_by_ids(User, author_ids, recount_users)
+
+    def save_formset(self, request, form, formset, change):
+        """Ингредиенты рецепта сохраняются тремя запросами на весь список.
+
+        Порядок — удаление, изменение, добавление — освобождает
+        ингредиенты удалённых строк для новых.
+        """
+
+        if formset.model is not IngredientInRecipe:
+            return super().save_formset(request, form, formset, change)
+        recipe = formset.instance
+        before = shopping_list.get_amounts([recipe.pk])
+        formset.save(commit=False)
+        IngredientInRecipe.objects.filter(
+            pk__in=[obj.pk for obj in formset.deleted_objects]
+        ).delete()
+        IngredientInRecipe.objects.bulk_update(
+            [obj for obj, _ in formset.changed_objects],
+            ('ingredient', 'amount'),
+        )
+        IngredientInRecipe.objects.bulk_create(formset.new_objects)
+        shopping_list.change_recipe_ingredients(
+            recipe.pk, before, shopping_list.get_amounts([recipe.pk])
+        )
+
+
+class RecipeRelationAdmin(LargeTableAdmin):
+    """Избранное и списки покупок с пересчётом счётчиков рецептов.
+
+    Админка меняет связи мимо API, поэтому счётчики затронутых
+    рецептов пересчитываются по таблицам связей (recount_recipes).
+    """
 
-class FavoriteAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'recipe')
-    list_editable = ('user', 'recipe')
+    list_select_related = ('user', 'recipe__author')
+    search_fields = ('user__username', 'recipe__name')
+    autocomplete_fields = ('user', 'recipe')
+
+    def save_model(self, request, obj, form, change):
+        recipe_ids = {obj.recipe_id}
+        if change:
+            recipe_ids.add(self.model.objects.get(pk=obj.pk).recipe_id)
+        super().save_model(request, obj, form, change)
+        recount_by_ids(Recipe, recipe_ids, recount_recipes)
 
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        recount_by_ids(Recipe, {obj.recipe_id}, recount_recipes)
 
-class IngredientInRecipeAdmin(admin.ModelAdmin):
+    def delete_queryset(self, request, queryset):
+        recipe_ids = set(queryset.values_list('recipe_id', flat=True))
+        super().delete_queryset(request, queryset)
+        recount_by_ids(Recipe, recipe_ids, recount_recipes)
+
+
+class ShoppingListAdmin(RecipeRelationAdmin):
+    def save_model(self, request, obj, form, change):
+        if change:
+            previous = ShoppingCard.objects.get(pk=obj.pk)
+            shopping_list.change_recipes(
+                previous.user_id, [previous.recipe_id], -1
+            )
+        super().save_model(request, obj, form, change)
+        shopping_list.change_recipes(obj.user_id, [obj.recipe_id], 1)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        shopping_list.change_recipes(obj.user_id, [obj.recipe_id], -1)
+
+    def delete_queryset(self, request, queryset):
+        carts = list(queryset.values_list('user_id', 'recipe_id'))
+        super().delete_queryset(request, queryset)
+        for user_id, recipe_id in carts:
+            shopping_list.change_recipes(user_id, [recipe_id], -1)
+
+
+class FavoriteAdmin(RecipeRelationAdmin):
+    pass
+
+
+class IngredientInRecipeAdmin(LargeTableAdmin):
     list_display = ('id', 'recipe', 'ingredient', 'amount',)
-    list_editable = ('recipe', 'ingredient', 'amount')
+    list_editable = ('amount',)
+    list_select_related = ('recipe__author', 'ingredient')
+    search_fields = ('recipe__name', 'ingredient__name')
+    autocomplete_fields = ('recipe', 'ingredient')
+
+    def save_model(self, request, obj, form, change):
+        recipe_ids = {obj.recipe_id}
+        if change:
+            recipe_ids.add(
+                IngredientInRecipe.objects.get(pk=obj.pk).recipe_id
+            )
+        self.change_recipes(
+            recipe_ids, super().save_model, request, obj, form, change
+        )
+
+    def delete_model(self, request, obj):
+        self.change_recipes(
+            {obj.recipe_id}, super().delete_model, request, obj
+        )
+
+    def delete_queryset(self, request, queryset):
+        self.change_recipes(
+            set(queryset.values_list('recipe_id', flat=True)),
+            super().delete_queryset, request, queryset,
+        )
+
+    def change_recipes(self, recipe_ids, handler, *args):
+        """Изменение ингредиентов с обновлением затронутых рецептов.
+
+        Рецепты пересохраняются, чтобы обновить их кэш и индекс,
+        а разница в ингредиентах применяется к спискам покупок.
+        """
+
+        before = {pk: shopping_list.get_amounts([pk]) for pk in recipe_ids}
+        handler(*args)
+        for recipe in Recipe.objects.filter(pk__in=recipe_ids).only(
+            'id', 'updated_at'
+        ):
+            recipe.save(update_fields=('updated_at',))
+            shopping_list.change_recipe_ingredients(
+                recipe.pk, before[recipe.pk],
+                shopping_list.get_amounts([recipe.pk]),
+            )
 
 
 admin.site.register(Tag, TagAdmin)
@@ -0,0 +1,23 @@
+from uuid import uuid4
+
+from django.core.cache import cache
+
+VERSION_KEY = 'reference:{namespace}:version'
+
+
+def get_version(namespace):
+    """Текущая версия справочника; создаётся при первом обращении."""
+
+    key = VERSION_KEY.format(namespace=namespace)
+    version = cache.get(key)
+    if version is None:
+        version = uuid4().hex
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_version(namespace):
+    """Новая версия справочника: все закэшированные ответы устаревают."""
+
+    cache.set(VERSION_KEY.format(namespace=namespace), uuid4().hex, None)
@@ -0,0 +1,321 @@
+import gzip
+import json
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef
+from django.utils.dateparse import parse_datetime
+
+from recipes.cache import bump_version
+from recipes.counters import recount_users
+from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag
+from recipes.shopping_list import batched
+
+User = get_user_model()
+
+GZIP_MAGIC = b'\x1f\x8b'
+TAG_FIELDS = ('id', 'name', 'color', 'slug')
+INGREDIENT_FIELDS = ('id', 'name', 'measurement_unit')
+USER_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name')
+RECIPE_FIELDS = (
+    'id', 'author_id', 'name', 'text', 'cooking_time', 'image',
+    'image_variants', 'pub_date',
+)
+
+
+def open_catalog(path, mode, compress=False):
+    """Текстовый файл каталога, при необходимости сжатый gzip.
+
+    При чтении сжатие определяется по сигнатуре файла.
+    """
+
+    if mode == 'r':
+        with open(path, 'rb') as file:
+            compress = file.read(2) == GZIP_MAGIC
+    if compress:
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def write_records(file, records):
+    """Запись объектов построчно в формате NDJSON."""
+
+    count = 0
+    for record in records:
+        file.write(json.dumps(record, ensure_ascii=False))
+        file.write('\n')
+        count += 1
+    return count
+
+
+def read_records(file):
+    for number, line in enumerate(file, 1):
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as error:
+                raise ValueError(f'Строка {number}: {error}') from error
+
+
+def iter_rows(queryset, fields, record_type, chunk_size):
+    for row in queryset.order_by('id').values(*fields).iterator(
+        chunk_size=chunk_size
+    ):
+        yield {'type': record_type, **row}
+
+
+def iter_recipes(chunk_size):
+    """Рецепты с тегами и ингредиентами пачками по chunk_size.
+
+    prefetch_related не работает с iterator(), поэтому связи каждой
+    пачки читаются двумя отдельными запросами.
+    """
+
+    rows = Recipe.objects.order_by('id').values(*RECIPE_FIELDS).iterator(
+        chunk_size=chunk_size
+    )
+    for batch in batched(rows, chunk_size):
+        recipe_ids = [row['id'] for row in batch]
+        tags = {}
+        for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'tag_id').order_by('id'):
+            tags.setdefault(recipe_id, []).append(tag_id)
+        ingredients = {}
+        for recipe_id, ingredient_id, amount in (
+            IngredientInRecipe.objects.filter(recipe_id__in=recipe_ids)
+            .values_list('recipe_id', 'ingredient_id', 'amount')
+            .order_by('id')
+        ):
+            ingredients.setdefault(recipe_id, []).append(
+                [ingredient_id, amount]
+            )
+        for row in batch:
+            yield {
+                'type': 'recipe',
+                **row,
+                'pub_date': row['pub_date'].isoformat(),
+                'tags': tags.get(row['id'], []),
+                'ingredients': ingredients.get(row['id'], []),
+            }
+
+
+def export_catalog(chunk_size):
+    """Записи каталога в порядке, нужном для импорта.
+
+    Справочники и авторы идут раньше рецептов, которые ссылаются на
+    них по id исходной базы. Выгружаются только авторы рецептов и без
+    паролей.
+    """
+
+    yield from iter_rows(Tag.objects.all(), TAG_FIELDS, 'tag', chunk_size)
+    yield from iter_rows(
+        Ingredient.objects.all(), INGREDIENT_FIELDS, 'ingredient', chunk_size
+    )
+    yield from iter_rows(
+        User.objects.filter(
+            Exists(Recipe.objects.filter(author=OuterRef('pk')))
+        ),
+        USER_FIELDS,
+        'user',
+        chunk_size,
+    )
+    yield from iter_recipes(chunk_size)
+
+
+class CatalogImporter:
+    """Загрузка записей export_catalog пачками bulk_create.
+
+    Теги, ингредиенты и авторы сопоставляются с существующими по slug,
+    паре «название, единица» и логину, новые создаются. Словари
+    соответствия id растут только со справочниками и числом авторов;
+    рецепты проходят через память пачками по batch_size, каждая пачка
+    сохраняется в своей транзакции.
+    """
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.ids = {'tag': {}, 'ingredient': {}, 'user': {}}
+        self.pending = {'tag': [], 'ingredient': [], 'user': []}
+        self.recipes = []
+        self.created = dict.fromkeys(
+            ('tag', 'ingredient', 'user', 'recipe'), 0
+        )
+        self.loaders = {
+            'tag': self.load_tags,
+            'ingredient': self.load_ingredients,
+            'user': self.load_users,
+        }
+
+    def add(self, record):
+        record_type = record.get('type')
+        if record_type == 'recipe':
+            self.flush_references()
+            self.recipes.append(record)
+            if len(self.recipes) >= self.batch_size:
+                self.flush_recipes()
+        elif record_type in self.pending:
+            self.pending[record_type].append(record)
+            if len(self.pending[record_type]) >= self.batch_size:
+                self.flush(record_type)
+        else:
+            raise ValueError(f'Неизвестный тип записи: {record_type}.')
+
+    def finish(self):
+        self.flush_references()
+        self.flush_recipes()
+        if self.created['tag']:
+            bump_version('tags')
+        if self.created['ingredient']:
+            bump_version('ingredients')
+        for authors in batched(self.ids['user'].values(), self.batch_size):
+            recount_users(User.objects.filter(id__in=authors))
+
+    def flush_references(self):
+        for record_type in self.pending:
+            self.flush(record_type)
+
+    def flush(self, record_type):
+        records = self.pending[record_type]
+        if records:
+            with transaction.atomic():
+                self.loaders[record_type](records)
+            self.pending[record_type] = []
+
+    def load_tags(self, records):
+        self.load(
+            Tag, 'tag', records,
+            lambda record: record['slug'],
+            lambda slugs: dict(Tag.objects.filter(
+                slug__in=slugs
+            ).values_list('slug', 'id')),
+            lambda record: Tag(
+                name=record['name'], color=record['color'],
+                slug=record['slug'],
+            ),
+        )
+
+    def load_ingredients(self, records):
+        def find(keys):
+            return {
+                (name, unit): pk
+                for pk, name, unit in Ingredient.objects.filter(
+                    name__in={name for name, _ in keys}
+                ).values_list('id', 'name', 'measurement_unit')
+                if (name, unit) in keys
+            }
+
+        self.load(
+            Ingredient, 'ingredient', records,
+            lambda record: (record['name'], record['measurement_unit']),
+            find,
+            lambda record: Ingredient(
+                name=record['name'],
+                measurement_unit=record['measurement_unit'],
+            ),
+        )
+
+    def load_users(self, records):
+        password = make_password(None)
+        self.load(
+            User, 'user', records,
+            lambda record: record['username'],
+            lambda usernames: dict(User.objects.filter(
+                username__in=usernames
+            ).values_list('username', 'id')),
+            lambda record: User(
+                username=record['username'], email=record['email'],
+                first_name=record['first_name'],
+                last_name=record['last_name'], password=password,
+            ),
+        )
+
+    def load(self, model, record_type, records, get_key, find, build):
+        """Сопоставить записи с базой и создать недостающие строки.
+
+        find(keys) возвращает {ключ: id} для сохранённых строк. id в
+        базе запоминается для id каждой записи из файла.
+        """
+
+        keys = {get_key(record) for record in records}
+        existing = find(keys)
+        missing = [
+            record for record in records if get_key(record) not in existing
+        ]
+        if missing:
+            model.objects.bulk_create(
+                [build(record) for record in missing], ignore_conflicts=True
+            )
+            created = find(keys - existing.keys())
+            self.created[record_type] += len(created)
+            existing.update(created)
+        for record in records:
+            key = get_key(record)
+            if key not in existing:
+                raise ValueError(
+                    f'Не удалось сохранить {record_type} {key}: '
+                    'конфликт с существующей записью.'
+                )
+            self.ids[record_type][record['id']] = existing[key]
+
+    def get_id(self, record_type, pk):
+        try:
+            return self.ids[record_type][pk]
+        except KeyError:
+            raise ValueError(
+                f'Рецепт ссылается на {record_type} {pk}, '
+                'которого нет в файле выше.'
+            ) from None
+
+    def flush_recipes(self):
+        """Сохранить пачку рецептов с тегами и ингредиентами.
+
+        SQLite не возвращает id из bulk_create, поэтому они берутся
+        выборкой новых строк; внутри транзакции SQLite они идут подряд.
+        Дата публикации восстанавливается отдельным UPDATE: bulk_create
+        заполняет её текущим временем.
+        """
+
+        records, self.recipes = self.recipes, []
+        if not records:
+            return
+        with transaction.atomic():
+            last_id = Recipe.objects.aggregate(last_id=Max('id'))['last_id']
+            recipes = Recipe.objects.bulk_create(
+                Recipe(
+                    name=record['name'],
+                    text=record['text'],
+                    cooking_time=record['cooking_time'],
+                    image=record['image'],
+                    image_variants=record['image_variants'],
+                    author_id=self.get_id('user', record['author_id']),
+                )
+                for record in records
+            )
+            if recipes[0].pk is None:
+                new_ids = Recipe.objects.filter(
+                    id__gt=last_id or 0
+                ).order_by('id').values_list('id', flat=True)
+                for recipe, pk in zip(recipes, new_ids):
+                    recipe.pk = pk
+            for recipe, record in zip(recipes, records):
+                recipe.pub_date = parse_datetime(record['pub_date'])
+            Recipe.objects.bulk_update(recipes, ('pub_date',))
+            Recipe.tags.through.objects.bulk_create(
+                Recipe.tags.through(
+                    recipe_id=recipe.pk, tag_id=self.get_id('tag', tag)
+                )
+                for recipe, record in zip(recipes, records)
+                for tag in record['tags']
+            )
+            IngredientInRecipe.objects.bulk_create(
+                IngredientInRecipe(
+                    recipe_id=recipe.pk,
+                    ingredient_id=self.get_id('ingredient', ingredient),
+                    amount=amount,
+                )
+                for recipe, record in zip(recipes, records)
+                for ingredient, amount in record['ingredients']
+            )
+        self.created['recipe'] += len(recipes)
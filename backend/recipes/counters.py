@@ -0,0 +1,82 @@
+from django.db import connections
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import Favorite, Recipe, ShoppingCard
+from recipes.shopping_list import batched
+from users.models import Subscription
+
+RECOUNT_BATCH_SIZE = 500
+
+
+def change_counter(queryset, field, delta):
+    """Изменить счётчик одним UPDATE, не опуская его ниже нуля."""
+
+    return queryset.update(**{field: Greatest(F(field) + delta, 0)})
+
+
+def lock_rows(queryset):
+    """Заблокировать строки queryset до конца транзакции.
+
+    Связи пользователя с рецептом или автором меняются только под
+    блокировкой этой строки, поэтому проверка наличия связи, вставка
+    и изменение счётчика не пересекаются с параллельным запросом.
+    Строки блокируются по возрастанию id, чтобы массовые операции не
+    ждали друг друга по кругу. FOR NO KEY UPDATE не мешает вставке
+    строк, ссылающихся на заблокированные. Без поддержки блокировок
+    (SQLite) запрос не выполняется: там записи и так идут по очереди.
+    """
+
+    features = connections[queryset.select_for_update().db].features
+    if features.has_select_for_update:
+        list(
+            queryset.select_for_update(
+                no_key=features.has_select_for_no_key_update
+            ).order_by('pk').values_list('pk', flat=True)
+        )
+
+
+def count_related(queryset, field):
+    """Подзапрос с числом строк queryset, ссылающихся на объект."""
+
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(count=Count('pk'))
+            .values('count')
+        ),
+        0,
+    )
+
+
+def recount_recipes(queryset):
+    """Пересчитать счётчики рецептов одним UPDATE."""
+
+    return queryset.update(
+        favorites_count=count_related(Favorite.objects.all(), 'recipe'),
+        in_carts_count=count_related(ShoppingCard.objects.all(), 'recipe'),
+    )
+
+
+def recount_users(queryset):
+    """Пересчитать счётчики пользователей одним UPDATE."""
+
+    return queryset.update(
+        recipes_count=count_related(Recipe.objects.all(), 'author'),
+        subscribers_count=count_related(
+            Subscription.objects.all(), 'author'
+        ),
+    )
+
+
+def recount_by_ids(model, ids, recount):
+    """Пересчитать счётчики объектов model с id из ids пачками.
+
+    recount — recount_recipes или recount_users. Нужен там, где связи
+    меняются мимо API, например в админке.
+    """
+
+    for batch in batched(ids, RECOUNT_BATCH_SIZE):
+        recount(model.objects.filter(pk__in=batch))
@@ -0,0 +1,120 @@
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'recipes_recipe_fts'
+SEARCH_CONFIG = 'russian'
+WORD = re.compile(r'\w+')
+
+SQLITE_TRIGGERS = {
+    f'{FTS_TABLE}_insert': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert
+        AFTER INSERT ON recipes_recipe BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, name, text)
+            VALUES (new.id, new.name, new.text);
+        END
+    """,
+    f'{FTS_TABLE}_delete': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete
+        AFTER DELETE ON recipes_recipe BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text)
+            VALUES ('delete', old.id, old.name, old.text);
+        END
+    """,
+    f'{FTS_TABLE}_update': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update
+        AFTER UPDATE OF name, text ON recipes_recipe BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text)
+            VALUES ('delete', old.id, old.name, old.text);
+            INSERT INTO {FTS_TABLE}(rowid, name, text)
+            VALUES (new.id, new.name, new.text);
+        END
+    """,
+}
+
+
+def ensure_sqlite_triggers(sender, using, **kwargs):
+    """Триггеры синхронизации FTS5 после каждого migrate.
+
+    SQLite пересоздаёт таблицу recipes_recipe при многих изменениях
+    схемы и теряет её триггеры, поэтому они проверяются и при
+    необходимости создаются заново вместе с перестроением индекса.
+    """
+
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return
+    with db.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master "
+            "WHERE type = 'table' AND name = %s",
+            (FTS_TABLE,),
+        )
+        if cursor.fetchone() is None:
+            return
+        cursor.execute(
+            "SELECT name FROM sqlite_master "
+            "WHERE type = 'trigger' AND tbl_name = 'recipes_recipe'"
+        )
+        missing = SQLITE_TRIGGERS.keys() - {row[0] for row in cursor}
+        if not missing:
+            return
+        for name in missing:
+            cursor.execute(SQLITE_TRIGGERS[name])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+        )
+
+
+def search_recipes(queryset, value):
+    """Рецепты, содержащие все слова запроса, с оценкой search_rank.
+
+    Индекс создаётся миграцией 0011_recipe_fulltext: в SQLite это
+    таблица FTS5 с триггерами, в PostgreSQL — вычисляемый столбец
+    tsvector с GIN-индексом и русским стеммингом. Обе СУБД обновляют
+    индекс сами при любой записи в recipes_recipe. На других СУБД
+    поиск идёт через icontains.
+
+    Каждое слово ищется как префикс. Чем выше search_rank, тем
+    релевантнее рецепт; совпадения в названии весят больше, чем
+    в тексте.
+    """
+
+    words = WORD.findall(value.lower())
+    if not words:
+        return queryset
+    vendor = connections[queryset.db].vendor
+    if vendor == 'sqlite':
+        # Оценка bm25() доступна только в том же запросе, где MATCH,
+        # поэтому таблица FTS5 присоединяется через extra(): коррелированный
+        # подзапрос повторял бы поиск для каждой найденной строки.
+        query = ' '.join(f'"{word}"*' for word in words)
+        return queryset.extra(
+            select={'search_rank': f'-bm25({FTS_TABLE}, 10.0, 1.0)'},
+            tables=(FTS_TABLE,),
+            where=(
+                f'{FTS_TABLE}.rowid = recipes_recipe.id',
+                f'{FTS_TABLE} MATCH %s',
+            ),
+            params=(query,),
+        )
+    if vendor == 'postgresql':
+        query = ' & '.join(f'{word}:*' for word in words)
+        tsquery = f"to_tsquery('{SEARCH_CONFIG}', %s)"
+        return queryset.annotate(search_match=RawSQL(
+            f'recipes_recipe.search_vector @@ {tsquery}',
+            (query,),
+            output_field=BooleanField(),
+        )).filter(search_match=True).annotate(search_rank=RawSQL(
+            f'ts_rank(recipes_recipe.search_vector, {tsquery})',
+            (query,),
+            output_field=FloatField(),
+        ))
+    condition = Q()
+    for word in words:
+        condition &= Q(name__icontains=word) | Q(text__icontains=word)
+    return queryset.filter(condition).annotate(
+        search_rank=RawSQL('0', (), output_field=FloatField())
+    )
@@ -0,0 +1,138 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from PIL import Image
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.utils import timezone
+
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+VARIANTS = {
+    'thumbnail': (240, 240),
+    'card': (640, 640),
+    'full': (1600, 1600),
+}
+FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 85, 'optimize': True,
+             'progressive': True},
+}
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.RECIPE_IMAGE_WORKERS,
+    thread_name_prefix='recipe-images',
+)
+
+
+def variant_name(source, variant, extension):
+    """Имя файла копии рядом с оригиналом: recipes/<имя>_<вариант>.<ext>."""
+
+    path = PurePosixPath(source)
+    return str(path.with_name(f'{path.stem}_{variant}.{extension}'))
+
+
+def encode(image, extension):
+    if extension == 'jpeg' and image.mode != 'RGB':
+        background = Image.new('RGB', image.size, 'white')
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background.paste(image, mask=image.getchannel('A'))
+        else:
+            background.paste(image.convert('RGB'))
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, **FORMATS[extension])
+    return buffer.getvalue()
+
+
+def build_variants(source):
+    """Создание уменьшенных копий изображения в WebP и JPEG.
+
+    Возвращает описание, которое сохраняется в Recipe.image_variants.
+    """
+
+    with default_storage.open(source) as file:
+        original = Image.open(file)
+        original.load()
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA')
+
+    files = {}
+    for variant, size in VARIANTS.items():
+        image = original.copy()
+        image.thumbnail(size, Image.LANCZOS)
+        files[variant] = {'width': image.width, 'height': image.height}
+        for extension in FORMATS:
+            name = variant_name(source, variant, extension)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            files[variant][extension] = default_storage.save(
+                name, ContentFile(encode(image, extension))
+            )
+    return {'source': source, 'files': files}
+
+
+def get_variant_files(variants):
+    return {
+        file
+        for files in variants.get('files', {}).values()
+        for extension, file in files.items()
+        if extension in FORMATS
+    }
+
+
+def delete_variants(variants, keep=()):
+    """Удалить файлы копий, если их исходник больше не у рецептов.
+
+    Рецепты с одним и тем же файлом изображения делят и его копии.
+    """
+
+    source = variants.get('source')
+    if not source or Recipe.objects.filter(image=source).exists():
+        return
+    for name in get_variant_files(variants) - set(keep):
+        default_storage.delete(name)
+
+
+def generate_variants(recipe_id, source):
+    """Создать копии и записать их, если изображение рецепта не сменилось.
+
+    Копии прежнего изображения рецепта удаляются.
+    """
+
+    previous = Recipe.objects.filter(pk=recipe_id).values_list(
+        'image_variants', flat=True
+    ).first() or {}
+    variants = build_variants(source)
+    updated = Recipe.objects.filter(image=source).update(
+        image_variants=variants,
+        updated_at=timezone.now(),
+    )
+    if updated and previous.get('source') != source:
+        delete_variants(previous, keep=get_variant_files(variants))
+
+
+def generate_variants_in_worker(recipe_id, source):
+    try:
+        generate_variants(recipe_id, source)
+    except Exception:
+        logger.exception('Не удалось создать копии изображения %s', source)
+    finally:
+        connection.close()
+
+
+def schedule_variants(recipe_id, source):
+    """Поставить генерацию копий в очередь фонового потока."""
+
+    if settings.RECIPE_IMAGE_VARIANTS_ASYNC:
+        executor.submit(generate_variants_in_worker, recipe_id, source)
+    else:
+        generate_variants(recipe_id, source)
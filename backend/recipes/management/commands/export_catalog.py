@@ -0,0 +1,43 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from recipes.catalog import export_catalog, open_catalog, write_records
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгрузка тегов, ингредиентов, авторов и рецептов в NDJSON '
+        'для import_catalog.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу каталога.')
+        parser.add_argument(
+            '--gzip',
+            action='store_true',
+            help='Сжать файл; включается и расширением .gz.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Количество строк, читаемых из базы за раз.',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        started = perf_counter()
+        with open_catalog(
+            path, 'w', options['gzip'] or path.endswith('.gz')
+        ) as file:
+            written = write_records(
+                file, export_catalog(options['chunk_size'])
+            )
+
+        elapsed = perf_counter() - started
+        rate = written / elapsed if elapsed else written
+        self.stdout.write(self.style.SUCCESS(
+            f'Выгружено {written} записей в {path} '
+            f'за {elapsed:.2f} с ({rate:.0f} записей/с).'
+        ))
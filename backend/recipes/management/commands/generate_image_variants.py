@@ -0,0 +1,68 @@
+from time import perf_counter
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from recipes.images import generate_variants, get_variant_files
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Создание недостающих и устаревших копий изображений рецептов. '
+        'Нужна для рецептов, созданных до появления копий, и для задач '
+        'фонового потока, потерянных при перезапуске процесса.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать копии всех рецептов.',
+        )
+        parser.add_argument(
+            '--check-files',
+            action='store_true',
+            help='Считать устаревшими копии, файлов которых нет в хранилище.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Количество рецептов, читаемых из базы за раз.',
+        )
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        sources = set()
+        failed = 0
+        rows = Recipe.objects.exclude(image='').order_by('id').values_list(
+            'id', 'image', 'image_variants'
+        ).iterator(chunk_size=options['chunk_size'])
+        for recipe_id, source, variants in rows:
+            if source in sources or not (
+                options['all'] or self.is_stale(
+                    source, variants, options['check_files']
+                )
+            ):
+                continue
+            # Копии записываются всем рецептам с этим файлом сразу.
+            sources.add(source)
+            try:
+                generate_variants(recipe_id, source)
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'Рецепт {recipe_id}, {source}: {error}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {len(sources) - failed}, '
+            f'ошибок: {failed} за {perf_counter() - started:.1f} с.'
+        ))
+
+    def is_stale(self, source, variants, check_files):
+        if variants.get('source') != source:
+            return True
+        return check_files and not all(
+            default_storage.exists(name)
+            for name in get_variant_files(variants)
+        )
@@ -0,0 +1,57 @@
+from pathlib import Path
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.catalog import CatalogImporter, open_catalog, read_records
+
+
+class Command(BaseCommand):
+    help = (
+        'Загрузка каталога из файла export_catalog. Каждая пачка '
+        'сохраняется в своей транзакции, поэтому после ошибки уже '
+        'загруженные рецепты остаются в базе.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Путь к файлу каталога; сжатие gzip определяется само.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество записей в одной транзакции.',
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден.')
+
+        importer = CatalogImporter(options['batch_size'])
+        started = perf_counter()
+        processed = 0
+        try:
+            with open_catalog(path, 'r') as file:
+                for record in read_records(file):
+                    importer.add(record)
+                    processed += 1
+                    if options['verbosity'] > 1 and not processed % 10000:
+                        self.stdout.write(f'Прочитано {processed} записей.')
+            importer.finish()
+        except (KeyError, TypeError, ValueError) as error:
+            raise CommandError(
+                f'Ошибка после {processed} записей: {error!r}'
+            ) from error
+
+        elapsed = perf_counter() - started
+        rate = processed / elapsed if elapsed else processed
+        created = importer.created
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано {processed} записей за {elapsed:.2f} с '
+            f'({rate:.0f} записей/с). Добавлено рецептов: '
+            f'{created["recipe"]}, тегов: {created["tag"]}, ингредиентов: '
+            f'{created["ingredient"]}, пользователей: {created["user"]}.'
+        ))
@@ -0,0 +1,154 @@
+import csv
+import json
+from itertools import islice
+from pathlib import Path
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.cache import bump_version
+from recipes.models import Ingredient
+
+DEFAULT_PATH = Path(settings.BASE_DIR).parent / 'data' / 'ingredients.csv'
+READ_SIZE = 64 * 1024
+SEPARATORS = ' \t\r\n,'
+
+
+def read_csv(file):
+    """Строки CSV-файла вида «название,единица измерения»."""
+
+    for row in csv.reader(file):
+        if row:
+            yield row[0], row[1]
+
+
+def read_json(file):
+    """Объекты JSON-массива, прочитанные по частям без загрузки файла.
+
+    Объект, не уместившийся в прочитанную часть, дочитывается со
+    следующей. Если в конце файла остались недекодируемые данные или
+    массив не закрыт, загрузка прерывается с CommandError.
+    """
+
+    decoder = json.JSONDecoder()
+    buffer = ''
+    offset = 0
+    started = finished = False
+    for chunk in iter(lambda: file.read(READ_SIZE), ''):
+        buffer += chunk
+        position = 0
+        while not finished:
+            while position < len(buffer) and buffer[position] in SEPARATORS:
+                position += 1
+            if position == len(buffer):
+                break
+            if not started:
+                if buffer[position] != '[':
+                    raise CommandError('Ожидается JSON-массив ингредиентов.')
+                started = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                finished = True
+                position += 1
+                break
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            yield item['name'], item['measurement_unit']
+        offset += position
+        buffer = buffer[position:]
+
+    rest = buffer.strip()
+    if rest:
+        position = len(buffer) - len(buffer.lstrip())
+        try:
+            decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError as error:
+            position = error.pos
+        raise CommandError(
+            f'Некорректный JSON в символе {offset + position}: '
+            f'{rest[:40]!r}.'
+        )
+    if not started:
+        raise CommandError('Ожидается JSON-массив ингредиентов.')
+    if not finished:
+        raise CommandError(
+            f'Файл оборвался в символе {offset}: '
+            'массив ингредиентов не закрыт.'
+        )
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
+
+
+class Command(BaseCommand):
+    help = 'Загрузка ингредиентов из CSV или JSON файла.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=str(DEFAULT_PATH),
+            help='Путь к файлу с ингредиентами.',
+        )
+        parser.add_argument(
+            '--format',
+            choices=READERS,
+            help='Формат файла; по умолчанию определяется по расширению.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество ингредиентов в одном INSERT.',
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(
+                f'Неизвестный формат файла: {path.name}. '
+                'Укажите --format csv или --format json.'
+            )
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден.')
+
+        batch_size = options['batch_size']
+        started = perf_counter()
+        processed = 0
+        with path.open(encoding='utf-8') as file, transaction.atomic():
+            before = Ingredient.objects.count()
+            rows = READERS[file_format](file)
+            while True:
+                batch = [
+                    Ingredient(
+                        name=name.strip(),
+                        measurement_unit=measurement_unit.strip(),
+                    )
+                    for name, measurement_unit in islice(rows, batch_size)
+                ]
+                if not batch:
+                    break
+                Ingredient.objects.bulk_create(
+                    batch,
+                    batch_size=batch_size,
+                    ignore_conflicts=True,
+                )
+                processed += len(batch)
+            created = Ingredient.objects.count() - before
+            transaction.on_commit(lambda: bump_version('ingredients'))
+
+        elapsed = perf_counter() - started
+        rate = processed / elapsed if elapsed else processed
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано {processed} строк, добавлено {created} ингредиентов '
+            f'за {elapsed:.2f} с ({rate:.0f} строк/с).'
+        ))
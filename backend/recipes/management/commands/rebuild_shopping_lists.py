@@ -0,0 +1,33 @@
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.shopping_list import rebuild
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересборка списков покупок по корзинам пользователей '
+        'для исправления расхождений.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='users',
+                            help='Логин пользователя; можно указать '
+                                 'несколько раз. По умолчанию — все.')
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        users = None
+        if options['users']:
+            users = User.objects.filter(username__in=options['users'])
+        with transaction.atomic():
+            created = rebuild(users)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано {created} строк списков покупок '
+            f'за {perf_counter() - started:.1f} с.'
+        ))
@@ -0,0 +1,27 @@
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.counters import recount_recipes, recount_users
+from recipes.models import Recipe
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчёт счётчиков избранного, списков покупок, рецептов '
+        'и подписчиков по фактическим связям.'
+    )
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        with transaction.atomic():
+            recipes = recount_recipes(Recipe.objects.all())
+            users = recount_users(User.objects.all())
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано {recipes} рецептов и {users} пользователей '
+            f'за {perf_counter() - started:.1f} с.'
+        ))
@@ -0,0 +1,212 @@
+import random
+from io import BytesIO
+from itertools import accumulate
+from time import perf_counter
+
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from recipes.counters import recount_recipes, recount_users
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCard, Tag)
+from recipes.shopping_list import rebuild as rebuild_shopping_lists
+from users.models import Subscription
+
+User = get_user_model()
+
+PLACEHOLDER = 'recipes/perf_placeholder.png'
+TAG_COLORS = ('#E26C2D', '#49B64E', '#8775D2', '#F5A623', '#4A90E2')
+
+
+def zipf_weights(size, exponent):
+    """Веса рангов 1..size: немногие элементы получают большую часть."""
+
+    return list(accumulate(
+        1 / rank ** exponent for rank in range(1, size + 1)
+    ))
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерация синтетических пользователей, рецептов, избранного, '
+        'списков покупок и подписок для нагрузочного тестирования.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=5)
+        parser.add_argument('--favorites', type=int, default=30,
+                            help='Среднее число избранных на пользователя.')
+        parser.add_argument('--carts', type=int, default=10,
+                            help='Среднее число рецептов в списке покупок.')
+        parser.add_argument('--subscriptions', type=int, default=20,
+                            help='Среднее число подписок на пользователя.')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Показатель распределения Ципфа.')
+        parser.add_argument('--prefix', default='perf',
+                            help='Префикс логинов и названий.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.skew = options['skew']
+        prefix = options['prefix']
+        started = perf_counter()
+
+        if not Ingredient.objects.exists():
+            call_command('load_ingredients', stdout=self.stdout)
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        image = self.get_placeholder()
+
+        with transaction.atomic():
+            users = self.create_users(prefix, options['users'])
+            tags = self.create_tags(prefix, options['tags'])
+            recipes = self.create_recipes(
+                prefix, options['recipes'], users, image
+            )
+            self.create_recipe_relations(recipes, tags, ingredient_ids)
+            self.create_user_relations(
+                Favorite, 'recipe', users, recipes, options['favorites']
+            )
+            self.create_user_relations(
+                ShoppingCard, 'recipe', users, recipes, options['carts']
+            )
+            self.create_user_relations(
+                Subscription, 'author', users, users, options['subscriptions']
+            )
+            recount_recipes(Recipe.objects.all())
+            recount_users(User.objects.all())
+            rebuild_shopping_lists()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано {len(users)} пользователей и {len(recipes)} рецептов '
+            f'за {perf_counter() - started:.1f} с.'
+        ))
+
+    def pick(self, population, weights, count):
+        return self.random.choices(population, cum_weights=weights, k=count)
+
+    def get_placeholder(self):
+        if not default_storage.exists(PLACEHOLDER):
+            buffer = BytesIO()
+            Image.new('RGB', (1200, 800), '#E26C2D').save(buffer, 'PNG')
+            default_storage.save(PLACEHOLDER, ContentFile(buffer.getvalue()))
+        return PLACEHOLDER
+
+    def create_users(self, prefix, count):
+        password = make_password(None)
+        User.objects.bulk_create(
+            [
+                User(
+                    username=f'{prefix}_user_{number}',
+                    email=f'{prefix}_user_{number}@example.com',
+                    first_name='Пользователь',
+                    last_name=str(number),
+                    password=password,
+                )
+                for number in range(count)
+            ],
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+        return list(
+            User.objects.filter(username__startswith=f'{prefix}_user_')
+            .order_by('id').values_list('id', flat=True)
+        )
+
+    def create_tags(self, prefix, count):
+        Tag.objects.bulk_create(
+            [
+                Tag(
+                    name=f'{prefix} тег {number}',
+                    slug=f'{prefix}_tag_{number}',
+                    color=TAG_COLORS[number % len(TAG_COLORS)],
+                )
+                for number in range(count)
+            ],
+            ignore_conflicts=True,
+        )
+        return list(
+            Tag.objects.filter(slug__startswith=f'{prefix}_tag_')
+            .values_list('id', flat=True)
+        )
+
+    def create_recipes(self, prefix, count, users, image):
+        """Рецепты распределяются по авторам по закону Ципфа."""
+
+        authors = self.pick(users, zipf_weights(len(users), self.skew), count)
+        last_id = Recipe.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        Recipe.objects.bulk_create(
+            [
+                Recipe(
+                    name=f'{prefix} рецепт {number}',
+                    text='Нарезать, смешать и запечь. ' * 20,
+                    cooking_time=self.random.randint(5, 180),
+                    image=image,
+                    author_id=author,
+                )
+                for number, author in enumerate(authors)
+            ],
+            batch_size=self.batch_size,
+        )
+        return list(
+            Recipe.objects.filter(id__gt=last_id)
+            .order_by('id').values_list('id', flat=True)
+        )
+
+    def create_recipe_relations(self, recipes, tags, ingredient_ids):
+        tag_links = []
+        ingredient_links = []
+        ingredient_weights = zipf_weights(len(ingredient_ids), 0.8)
+        for recipe in recipes:
+            tags_count = self.random.randint(1, min(3, len(tags)))
+            for tag in self.random.sample(tags, tags_count):
+                tag_links.append(
+                    Recipe.tags.through(recipe_id=recipe, tag_id=tag)
+                )
+            ingredients = set(self.pick(
+                ingredient_ids,
+                ingredient_weights,
+                self.random.randint(3, 15),
+            ))
+            for ingredient in ingredients:
+                ingredient_links.append(IngredientInRecipe(
+                    recipe_id=recipe,
+                    ingredient_id=ingredient,
+                    amount=self.random.randint(1, 500),
+                ))
+        Recipe.tags.through.objects.bulk_create(
+            tag_links, batch_size=self.batch_size, ignore_conflicts=True
+        )
+        IngredientInRecipe.objects.bulk_create(
+            ingredient_links, batch_size=self.batch_size
+        )
+
+    def create_user_relations(self, model, field, users, targets, average):
+        """Связи пользователей с популярными рецептами или авторами."""
+
+        weights = zipf_weights(len(targets), self.skew)
+        objects = []
+        for user in users:
+            count = min(
+                int(self.random.expovariate(1 / average)) if average else 0,
+                len(targets),
+            )
+            for target in set(self.pick(targets, weights, count)):
+                if field == 'author' and target == user:
+                    continue
+                objects.append(model(user_id=user, **{f'{field}_id': target}))
+        model.objects.bulk_create(
+            objects, batch_size=self.batch_size, ignore_conflicts=True
+        )
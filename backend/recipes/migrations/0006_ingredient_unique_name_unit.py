@@ -0,0 +1,67 @@
+# Generated by Django 3.2.3 on 2026-10-17 05:47
+
+from django.db import migrations, models
+
+MAX_AMOUNT = 32767
+
+
+def merge_duplicates(apps, schema_editor):
+    """Объединение одинаковых ингредиентов перед созданием ограничения.
+
+    Ингредиент рецепта защищён PROTECT, поэтому строки рецептов сначала
+    переводятся на ингредиент с наименьшим id, а количества одного
+    ингредиента, оказавшегося в рецепте дважды, складываются.
+    """
+
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientInRecipe = apps.get_model('recipes', 'IngredientInRecipe')
+    groups = list(
+        Ingredient.objects.values('name', 'measurement_unit').annotate(
+            keep_id=models.Min('id'), count=models.Count('id')
+        ).filter(count__gt=1).values_list(
+            'name', 'measurement_unit', 'keep_id'
+        )
+    )
+    recipe_ids = set()
+    for name, measurement_unit, keep_id in groups:
+        extra = Ingredient.objects.filter(
+            name=name, measurement_unit=measurement_unit
+        ).exclude(id=keep_id)
+        rows = IngredientInRecipe.objects.filter(ingredient__in=extra)
+        recipe_ids.update(rows.values_list('recipe_id', flat=True))
+        rows.update(ingredient_id=keep_id)
+        extra.delete()
+
+    repeated = list(
+        IngredientInRecipe.objects.filter(recipe_id__in=recipe_ids).values(
+            'recipe_id', 'ingredient_id'
+        ).annotate(
+            keep_id=models.Min('id'),
+            total=models.Sum('amount'),
+            count=models.Count('id'),
+        ).filter(count__gt=1).values_list(
+            'recipe_id', 'ingredient_id', 'keep_id', 'total'
+        )
+    )
+    for recipe_id, ingredient_id, keep_id, total in repeated:
+        IngredientInRecipe.objects.filter(id=keep_id).update(
+            amount=min(total, MAX_AMOUNT)
+        )
+        IngredientInRecipe.objects.filter(
+            recipe_id=recipe_id, ingredient_id=ingredient_id
+        ).exclude(id=keep_id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_rename_shoppinglist_shoppingcard'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.3 on 2026-10-17 05:52
+
+from django.db import migrations, models
+
+
+def remove_duplicates(apps, schema_editor):
+    """Удаление повторяющихся связей перед созданием ограничений."""
+
+    for model_name, fields in (
+        ('Favorite', ('user', 'recipe')),
+        ('ShoppingCard', ('user', 'recipe')),
+    ):
+        model = apps.get_model('recipes', model_name)
+        keep = model.objects.values(*fields).annotate(
+            keep_id=models.Min('id')
+        ).values('keep_id')
+        model.objects.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-pub_date', '-id'], name='recipe_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date'], name='recipe_author_pub_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorite'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcard',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_shopping_card'),
+        ),
+    ]
@@ -0,0 +1,288 @@
+import logging
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+from datetime import timedelta
+from heapq import nlargest
+from itertools import groupby
+from operator import itemgetter
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError
+from django.utils import timezone
+
+from recipes.cache import get_version
+from recipes.models import Ingredient, IngredientInRecipe, Recipe
+
+SEPARATOR = '\n'
+# Знаковые 8 байт: id из BigAutoField (DEFAULT_AUTO_FIELD) не помещаются
+# в 4-байтный 'I'.
+ID_TYPECODE = 'q'
+
+logger = logging.getLogger(__name__)
+
+
+class IngredientIndex:
+    """Индекс названий ингредиентов в памяти процесса.
+
+    Названия хранятся в casefold(), поэтому поиск корректно работает
+    с кириллицей. Сначала возвращаются совпадения по началу названия
+    (бинарный поиск по отсортированному списку), затем — по вхождению
+    в середину (str.find по склеенной строке всех названий).
+    Индекс перестраивается, когда меняется версия справочника
+    ингредиентов в общем кэше, поэтому изменения видны всем процессам.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._state = None
+
+    def build(self, version):
+        """Индекс для версии справочника.
+
+        Данные читаются с основной базы: реплика может отставать,
+        и индекс запомнился бы под новой версией со старыми данными.
+        """
+
+        rows = sorted(
+            (name.casefold(), pk, name, measurement_unit)
+            for pk, name, measurement_unit in Ingredient.objects.using(
+                DEFAULT_DB_ALIAS
+            ).values_list(
+                'id', 'name', 'measurement_unit'
+            ).order_by().iterator()
+        )
+        keys = [row[0].replace(SEPARATOR, ' ') for row in rows]
+        items = [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for _, pk, name, measurement_unit in rows
+        ]
+        offsets = []
+        position = 0
+        for key in keys:
+            offsets.append(position)
+            position += len(key) + len(SEPARATOR)
+        return {
+            'keys': keys,
+            'items': items,
+            'offsets': offsets,
+            'haystack': SEPARATOR.join(keys),
+            'version': version,
+        }
+
+    def get_state(self):
+        version = get_version('ingredients')
+        state = self._state
+        if state is None or state['version'] != version:
+            with self._lock:
+                state = self._state
+                if state is None or state['version'] != version:
+                    state = self._state = self.build(version)
+        return state
+
+    def search(self, query, limit):
+        """Ингредиенты, название которых содержит query."""
+
+        query = query.strip().casefold().replace(SEPARATOR, ' ')
+        if not query:
+            return []
+        state = self.get_state()
+        keys = state['keys']
+        items = state['items']
+        result = []
+
+        index = bisect_left(keys, query)
+        while (
+            index < len(keys)
+            and len(result) < limit
+            and keys[index].startswith(query)
+        ):
+            result.append(items[index])
+            index += 1
+
+        haystack = state['haystack']
+        offsets = state['offsets']
+        position = haystack.find(query)
+        while position != -1 and len(result) < limit:
+            index = bisect_right(offsets, position) - 1
+            if not keys[index].startswith(query):
+                result.append(items[index])
+            if index + 1 == len(offsets):
+                break
+            position = haystack.find(query, offsets[index + 1])
+        return result
+
+
+ingredient_index = IngredientIndex()
+
+
+def warm_up_ingredient_index():
+    """Построить индекс ингредиентов при запуске рабочего процесса.
+
+    Вызывается из wsgi.py и asgi.py, поэтому не срабатывает в migrate
+    и других командах manage.py. Без этого полный проход по таблице
+    и сортировку оплачивает первый запрос ?name=. Если база ещё
+    недоступна, индекс построится при первом поиске.
+    """
+
+    try:
+        ingredient_index.get_state()
+    except DatabaseError:
+        logger.exception('Не удалось построить индекс ингредиентов')
+
+
+class PantryIndex:
+    """Обратный индекс «ингредиент → рецепты» в памяти процесса.
+
+    Для каждого ингредиента хранится отсортированный массив id рецептов,
+    для каждого рецепта — массив id его ингредиентов. Запрос по набору
+    продуктов складывает совпадения по спискам этих ингредиентов и
+    делит на число ингредиентов рецепта, не обращаясь к базе.
+
+    Изменения рецептов своего процесса применяются сразу через сигналы.
+    Изменения из других процессов подтягиваются не чаще раза в
+    PANTRY_INDEX_REFRESH_INTERVAL секунд по полю updated_at с запасом
+    SYNC_OVERLAP на ещё не закоммиченные транзакции. Удалённые в других
+    процессах рецепты убираются из индекса, когда не находятся в базе.
+    """
+
+    SYNC_OVERLAP = timedelta(minutes=1)
+
+    def __init__(self):
+        self._lock = Lock()
+        self._state = None
+
+    def build(self):
+        synced_at = timezone.now() - self.SYNC_OVERLAP
+        postings = {}
+        recipes = {}
+        rows = IngredientInRecipe.objects.values_list(
+            'recipe_id', 'ingredient_id'
+        ).order_by('recipe_id', 'ingredient_id').iterator(chunk_size=10000)
+        for recipe_id, group in groupby(rows, key=itemgetter(0)):
+            ingredients = array(ID_TYPECODE, (row[1] for row in group))
+            recipes[recipe_id] = ingredients
+            for ingredient_id in ingredients:
+                postings.setdefault(
+                    ingredient_id, array(ID_TYPECODE)
+                ).append(recipe_id)
+        return {
+            'postings': postings,
+            'recipes': recipes,
+            'synced_at': synced_at,
+            'checked': monotonic(),
+        }
+
+    def get_state(self):
+        state = self._state
+        if state is None:
+            with self._lock:
+                state = self._state
+                if state is None:
+                    state = self._state = self.build()
+        elif (
+            monotonic() - state['checked']
+            > settings.PANTRY_INDEX_REFRESH_INTERVAL
+        ):
+            self.refresh(state)
+        return state
+
+    def refresh(self, state):
+        """Подтянуть рецепты, изменённые с прошлой синхронизации."""
+
+        with self._lock:
+            if (
+                monotonic() - state['checked']
+                <= settings.PANTRY_INDEX_REFRESH_INTERVAL
+            ):
+                return
+            synced_at = timezone.now() - self.SYNC_OVERLAP
+            changed = Recipe.objects.filter(
+                updated_at__gte=state['synced_at']
+            ).values_list('id', flat=True)
+            self._update(state, changed)
+            state['synced_at'] = synced_at
+            state['checked'] = monotonic()
+
+    def update_recipes(self, recipe_ids):
+        """Перечитать ингредиенты рецептов из базы."""
+
+        if self._state is None:
+            return
+        with self._lock:
+            self._update(self._state, recipe_ids)
+
+    def remove_recipes(self, recipe_ids):
+        if self._state is None:
+            return
+        with self._lock:
+            for recipe_id in recipe_ids:
+                self._remove(self._state, recipe_id)
+
+    def _update(self, state, recipe_ids):
+        recipe_ids = list(recipe_ids)
+        if not recipe_ids:
+            return
+        current = {}
+        for recipe_id, ingredient_id in IngredientInRecipe.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'ingredient_id').order_by('ingredient_id'):
+            current.setdefault(recipe_id, array(ID_TYPECODE)).append(
+                ingredient_id
+            )
+        for recipe_id in recipe_ids:
+            self._remove(state, recipe_id)
+            ingredients = current.get(recipe_id)
+            if not ingredients:
+                continue
+            state['recipes'][recipe_id] = ingredients
+            for ingredient_id in ingredients:
+                postings = state['postings'].setdefault(
+                    ingredient_id, array(ID_TYPECODE)
+                )
+                insort(postings, recipe_id)
+
+    def _remove(self, state, recipe_id):
+        ingredients = state['recipes'].pop(recipe_id, ())
+        for ingredient_id in ingredients:
+            recipes = state['postings'][ingredient_id]
+            index = bisect_left(recipes, recipe_id)
+            if index < len(recipes) and recipes[index] == recipe_id:
+                del recipes[index]
+
+    def rank(self, ingredient_ids, limit):
+        """Рецепты с наибольшей долей ингредиентов из набора.
+
+        Возвращает кортежи (id рецепта, доля, id недостающих
+        ингредиентов); при равной доле выше рецепт с большим числом
+        совпадений, затем более новый.
+        """
+
+        state = self.get_state()
+        postings = state['postings']
+        recipes = state['recipes']
+        pantry = set(ingredient_ids)
+        with self._lock:
+            hits = Counter()
+            for ingredient_id in pantry:
+                hits.update(postings.get(ingredient_id, ()))
+            best = nlargest(
+                limit,
+                hits.items(),
+                key=lambda item: (
+                    item[1] / len(recipes[item[0]]), item[1], item[0]
+                ),
+            )
+            return [
+                (
+                    recipe_id,
+                    count / len(recipes[recipe_id]),
+                    [pk for pk in recipes[recipe_id] if pk not in pantry],
+                )
+                for recipe_id, count in best
+            ]
+
+
+pantry_index = PantryIndex()
@@ -0,0 +1,120 @@
+from collections import Counter
+from itertools import islice
+
+from django.db.models import Case, F, Sum, When
+from django.db.models.functions import Greatest
+
+from recipes.models import IngredientInRecipe, ShoppingCard, ShoppingListItem
+
+BATCH_SIZE = 2000
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def get_amounts(recipe_ids):
+    """Суммарное количество каждого ингредиента в рецептах."""
+
+    return Counter(dict(
+        IngredientInRecipe.objects.filter(recipe_id__in=recipe_ids)
+        .values_list('ingredient_id')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    ))
+
+
+def change_items(users, amounts):
+    """Прибавить amounts {ingredient_id: разница} к спискам пользователей.
+
+    users — список id или подзапрос с id пользователей. Недостающие
+    строки создаются с нулём, затем все строки меняются одним UPDATE
+    через F(), поэтому параллельные изменения не теряются. Строки,
+    дошедшие до нуля, удаляются.
+    """
+
+    amounts = {pk: delta for pk, delta in amounts.items() if delta}
+    if not amounts:
+        return
+    added = [pk for pk, delta in amounts.items() if delta > 0]
+    if added:
+        missing = (
+            ShoppingListItem(
+                user_id=user, ingredient_id=ingredient, total_amount=0
+            )
+            for user in users
+            for ingredient in added
+        )
+        for batch in batched(missing, BATCH_SIZE):
+            ShoppingListItem.objects.bulk_create(batch, ignore_conflicts=True)
+    items = ShoppingListItem.objects.filter(
+        user_id__in=users, ingredient_id__in=amounts
+    )
+    items.update(total_amount=Greatest(
+        Case(*(
+            When(ingredient_id=pk, then=F('total_amount') + delta)
+            for pk, delta in amounts.items()
+        )),
+        0,
+    ))
+    if len(added) < len(amounts):
+        items.filter(total_amount=0).delete()
+
+
+def change_recipes(user_id, recipe_ids, sign):
+    """Рецепты добавлены в корзину (sign=1) или убраны из неё (sign=-1)."""
+
+    if recipe_ids:
+        change_items([user_id], {
+            pk: sign * amount
+            for pk, amount in get_amounts(recipe_ids).items()
+        })
+
+
+def change_recipe_ingredients(recipe_id, before, after):
+    """Ингредиенты рецепта изменились с before на after.
+
+    Разница применяется ко всем спискам, в корзинах которых
+    есть рецепт.
+    """
+
+    difference = Counter(after)
+    difference.subtract(before)
+    change_items(
+        ShoppingCard.objects.filter(recipe_id=recipe_id).values_list(
+            'user_id', flat=True
+        ),
+        difference,
+    )
+
+
+def rebuild(users=None):
+    """Пересобрать списки покупок по корзинам.
+
+    Без users пересобираются списки всех пользователей.
+    """
+
+    items = ShoppingListItem.objects.all()
+    carts = {'recipe__shopping_cart__isnull': False}
+    if users is not None:
+        items = items.filter(user__in=users)
+        carts = {'recipe__shopping_cart__user__in': users}
+    items.delete()
+    rows = IngredientInRecipe.objects.filter(**carts).values_list(
+        'recipe__shopping_cart__user', 'ingredient'
+    ).annotate(total=Sum('amount')).order_by()
+    created = 0
+    for batch in batched(rows.iterator(chunk_size=BATCH_SIZE), BATCH_SIZE):
+        ShoppingListItem.objects.bulk_create(
+            ShoppingListItem(
+                user_id=user, ingredient_id=ingredient, total_amount=total
+            )
+            for user, ingredient, total in batch
+        )
+        created += len(batch)
+    return created
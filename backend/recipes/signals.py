@@ -0,0 +1,125 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from recipes import shopping_list
+from recipes.cache import bump_version
+from recipes.images import delete_variants, schedule_variants
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.search import pantry_index
+
+User = get_user_model()
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def bump_tags_version(sender, **kwargs):
+    """Новая версия справочника тегов при его изменении."""
+
+    bump_version('tags')
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def bump_ingredients_version(sender, **kwargs):
+    """Новая версия справочника ингредиентов при его изменении."""
+
+    bump_version('ingredients')
+
+
+@receiver(post_save, sender=Recipe)
+def schedule_image_variants(sender, instance, **kwargs):
+    """Генерация копий изображения после сохранения нового файла."""
+
+    source = instance.image.name
+    if source and instance.image_variants.get('source') != source:
+        transaction.on_commit(
+            lambda: schedule_variants(instance.pk, source)
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def update_pantry_index(sender, instance, **kwargs):
+    """Перечитать ингредиенты рецепта в индексе после коммита."""
+
+    pk = instance.pk
+    transaction.on_commit(lambda: pantry_index.update_recipes((pk,)))
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_from_shopping_lists(sender, instance, **kwargs):
+    """Убрать ингредиенты удаляемого рецепта из списков покупок.
+
+    Корзины с рецептом удаляются каскадом, поэтому списки меняются
+    до удаления, пока известны и корзины, и ингредиенты рецепта.
+    """
+
+    shopping_list.change_recipe_ingredients(
+        instance.pk, shopping_list.get_amounts([instance.pk]), {}
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_image_variants(sender, instance, **kwargs):
+    """Удалить копии изображения удалённого рецепта после коммита."""
+
+    variants = instance.image_variants
+    transaction.on_commit(lambda: delete_variants(variants))
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_from_pantry_index(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: pantry_index.remove_recipes((pk,)))
+
+
+def touch_recipes(recipes):
+    """Сдвинуть дату изменения рецептов, чтобы сбросить их ETag."""
+
+    recipes.update(updated_at=timezone.now())
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def touch_recipes_on_tags_change(sender, instance, action, reverse, pk_set,
+                                 **kwargs):
+    """Изменение набора тегов рецепта."""
+
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        touch_recipes(Recipe.objects.filter(pk=instance.pk))
+    elif pk_set:
+        touch_recipes(Recipe.objects.filter(pk__in=pk_set))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def touch_tag_recipes(sender, instance, created=False, **kwargs):
+    """Изменение тега меняет представление всех его рецептов."""
+
+    if not created:
+        touch_recipes(Recipe.objects.filter(tags=instance))
+
+
+@receiver(post_save, sender=Ingredient)
+def touch_ingredient_recipes(sender, instance, created, **kwargs):
+    """Изменение ингредиента меняет представление его рецептов."""
+
+    if not created:
+        touch_recipes(Recipe.objects.filter(ingredients=instance))
+
+
+@receiver(post_save, sender=User)
+def touch_author_recipes(sender, instance, created, update_fields=None,
+                         **kwargs):
+    """Изменение данных автора меняет представление его рецептов.
+
+    Сохранения, не затрагивающие эти данные (например, last_login
+    при входе), рецепты не трогают.
+    """
+
+    if created or (update_fields and not AUTHOR_FIELDS & update_fields):
+        return
+    touch_recipes(Recipe.objects.filter(author=instance))
@@ -1,9 +1,13 @@
 from django.contrib import admin
 
+from foodgram.admin import LargeTableAdmin
+from recipes.counters import recount_by_ids, recount_recipes, recount_users
+from recipes.models import Favorite, Recipe, ShoppingCard
+
 from .models import CustomUser, Subscription
 
 
-class UserAdmin(admin.ModelAdmin):
+class UserAdmin(LargeTableAdmin):
     list_display = (
         'id',
         'username',
@@ -14,16 +18,61 @@ class UserAdmin(admin.ModelAdmin):
     )
     list_editable = ('password', )
     search_fields = ('username', 'email')
-    list_filter = ('username', 'email')
     empty_value_display = '-пусто-'
 
+    def delete_model(self, request, obj):
+        self.delete_users([obj.pk], super().delete_model, request, obj)
+
+    def delete_queryset(self, request, queryset):
+        self.delete_users(
+            list(queryset.values_list('pk', flat=True)),
+            super().delete_queryset, request, queryset,
+        )
+
+    def delete_users(self, user_ids, handler, *args):
+        """Удаление пользователей с пересчётом затронутых счётчиков.
+
+        Вместе с пользователем каскадом удаляются его подписки,
+        избранное и списки покупок, поэтому пересчитываются авторы,
+        на которых он был подписан, и рецепты из его связей.
+        """
+
+        author_ids = set(Subscription.objects.filter(
+            user__in=user_ids
+        ).values_list('author_id', flat=True))
+        recipe_ids = set()
+        for model in (Favorite, ShoppingCard):
+            recipe_ids.update(model.objects.filter(
+                user__in=user_ids
+            ).values_list('recipe_id', flat=True))
+        handler(*args)
+        recount_by_ids(CustomUser, author_ids, recount_users)
+        recount_by_ids(Recipe, recipe_ids, recount_recipes)
 
-class SubscriptionAdmin(admin.ModelAdmin):
+
+class SubscriptionAdmin(LargeTableAdmin):
     list_display = ('id', 'user', 'author')
-    list_editable = ('user', 'author')
-    search_fields = ('user', 'author')
+    list_select_related = ('user', 'author')
+    search_fields = ('user__username', 'author__username')
+    autocomplete_fields = ('user', 'author')
     empty_value_display = '-пусто-'
 
+    def save_model(self, request, obj, form, change):
+        author_ids = {obj.author_id}
+        if change:
+            author_ids.add(Subscription.objects.get(pk=obj.pk).author_id)
+        super().save_model(request, obj, form, change)
+        recount_by_ids(CustomUser, author_ids, recount_users)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        recount_by_ids(CustomUser, {obj.author_id}, recount_users)
+
+    def delete_queryset(self, request, queryset):
+        author_ids = set(queryset.values_list('author_id', flat=True))
+        super().delete_queryset(request, queryset)
+        recount_by_ids(CustomUser, author_ids, recount_users)
+
 
 admin.site.register(CustomUser, UserAdmin)
 admin.site.register(Subscription, SubscriptionAdmin)
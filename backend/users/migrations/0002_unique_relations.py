@@ -0,0 +1,40 @@
+# Generated by Django 3.2.3 on 2026-10-17 05:52
+
+from django.db import migrations, models
+import django.db.models.expressions
+
+
+def remove_duplicates(apps, schema_editor):
+    """Удаление повторяющихся подписок и подписок на себя."""
+
+    for model_name, fields in (
+        ('Subscription', ('user', 'author')),
+    ):
+        model = apps.get_model('users', model_name)
+        keep = model.objects.values(*fields).annotate(
+            keep_id=models.Min('id')
+        ).values('keep_id')
+        model.objects.exclude(id__in=keep).delete()
+    subscription = apps.get_model('users', 'Subscription')
+    subscription.objects.filter(
+        user=django.db.models.expressions.F('author')
+    ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='subscription',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_subscription'),
+        ),
+        migrations.AddConstraint(
+            model_name='subscription',
+            constraint=models.CheckConstraint(check=models.Q(('user', django.db.models.expressions.F('author')), _negated=True), name='prevent_self_subscription'),
+        ),
+    ]
@@ -1,12 +1,16 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
+from foodgram.db import CounterFieldsMixin
+
 from .validators import validate_username
 
 
-class CustomUser(AbstractUser):
+class CustomUser(CounterFieldsMixin, AbstractUser):
     """Модель пользователей."""
 
+    counter_fields = ('recipes_count', 'subscribers_count')
+
     username = models.CharField(
         max_length=150,
         unique=True,
@@ -32,6 +36,16 @@ class CustomUser(AbstractUser):
         max_length=150,
         verbose_name='Фамилия',
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество рецептов',
+    )
+    subscribers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество подписчиков',
+    )
 
     class Meta:
         ordering = ('id',)
@@ -61,6 +75,16 @@ class Subscription(models.Model):
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'author'),
+                name='unique_subscription',
+            ),
+            models.CheckConstraint(
+                check=~models.Q(user=models.F('author')),
+                name='prevent_self_subscription',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.user} подписан на {self.author}'
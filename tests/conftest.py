@@ -0,0 +1,51 @@
+import pytest
+from django.core.cache import cache
+from django.db import connections
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+
+@pytest.fixture(scope='session')
+def django_db_setup(django_db_setup, django_db_blocker):
+    """Схема и данные тестовой основной базы копируются в реплику.
+
+    Миграции на реплике запрещены роутером, как и в работе.
+    """
+
+    with django_db_blocker.unblock():
+        primary = connections['default']
+        replica = connections['replica']
+        primary.ensure_connection()
+        replica.ensure_connection()
+        primary.connection.backup(replica.connection)
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def user(django_user_model):
+    return django_user_model.objects.create_user(
+        username='TestUser', email='test@foodgram.fake', password='1234567',
+        first_name='Test', last_name='User',
+    )
+
+
+@pytest.fixture
+def another_user(django_user_model):
+    return django_user_model.objects.create_user(
+        username='AnotherUser', email='another@foodgram.fake',
+        password='1234567', first_name='Another', last_name='User',
+    )
+
+
+@pytest.fixture
+def user_client(user):
+    token = Token.objects.create(user=user)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
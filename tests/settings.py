@@ -0,0 +1,21 @@
+"""Настройки тестов: основная база и реплика — два файла SQLite."""
+
+import os
+import tempfile
+
+from foodgram.settings import *  # noqa: F401, F403
+
+TEST_DB_DIR = tempfile.mkdtemp(prefix='foodgram-tests-')
+
+DATABASES = {
+    alias: {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(TEST_DB_DIR, f'{alias}.sqlite3'),
+        'TEST': {
+            'NAME': os.path.join(TEST_DB_DIR, f'test_{alias}.sqlite3'),
+        },
+    }
+    for alias in ('default', 'replica')
+}
+
+MEDIA_ROOT = os.path.join(TEST_DB_DIR, 'media')
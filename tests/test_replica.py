@@ -0,0 +1,144 @@
+import pytest
+from django.contrib.sessions.models import Session
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from foodgram.db import REPLICA, ReplicaRouter, current_database
+from recipes.models import Recipe
+
+pytestmark = pytest.mark.django_db(databases=['default', 'replica'])
+
+REPLICA_URLS = (
+    '/api/recipes/',
+    '/api/tags/?format=api',
+    '/api/ingredients/?format=api',
+    '/api/users/',
+)
+
+
+def get_with_queries(client, url, **extra):
+    """Ответ и запросы, выполненные на основной базе и на реплике."""
+
+    with CaptureQueriesContext(connections['default']) as primary:
+        with CaptureQueriesContext(connections[REPLICA]) as replica:
+            response = client.get(url, **extra)
+    return response, primary.captured_queries, replica.captured_queries
+
+
+def subscribe(client, author):
+    response = client.post(f'/api/users/{author.id}/subscribe/')
+    assert response.status_code == 201, (
+        'Подписка в тесте должна создаваться'
+    )
+
+
+class TestReplicaReads:
+
+    @pytest.mark.parametrize('url', REPLICA_URLS)
+    def test_anonymous_reads_go_to_replica(self, client, url):
+        response, primary, replica = get_with_queries(client, url)
+        assert response.status_code == 200
+        assert replica, f'GET {url} должен читать с реплики'
+        assert not primary, f'GET {url} не должен читать основную базу'
+
+    @pytest.mark.parametrize('url', REPLICA_URLS)
+    def test_authenticated_reads_go_to_replica(self, user_client, url):
+        response, primary, replica = get_with_queries(user_client, url)
+        assert response.status_code == 200
+        assert replica, f'GET {url} должен читать с реплики'
+        assert all(
+            Token._meta.db_table in query['sql'] for query in primary
+        ), 'С основной базы читается только токен'
+
+    def test_reference_cache_is_filled_from_primary(self, client):
+        _, primary, replica = get_with_queries(client, '/api/tags/')
+        assert primary and not replica, (
+            'Кэш справочника заполняется по основной базе'
+        )
+        _, primary, replica = get_with_queries(client, '/api/tags/')
+        assert not primary and not replica
+
+    def test_unmarked_action_reads_primary(self, user_client):
+        _, primary, replica = get_with_queries(user_client, '/api/users/me/')
+        assert primary and not replica, (
+            'Действия без replica_actions читают основную базу'
+        )
+
+
+class TestPrimaryModels:
+
+    def test_token_and_session_are_pinned_to_primary(self):
+        router = ReplicaRouter()
+        token = current_database.set(REPLICA)
+        try:
+            assert router.db_for_read(Token) == 'default'
+            assert router.db_for_read(Session) == 'default'
+            assert router.db_for_read(Recipe) == REPLICA
+        finally:
+            current_database.reset(token)
+
+    def test_writes_go_to_primary(self):
+        router = ReplicaRouter()
+        token = current_database.set(REPLICA)
+        try:
+            assert router.db_for_write(Recipe) == 'default'
+            assert router.db_for_write(Token) == 'default'
+        finally:
+            current_database.reset(token)
+
+    def test_token_is_read_from_primary(self, user_client):
+        _, primary, replica = get_with_queries(user_client, '/api/recipes/')
+        assert any(Token._meta.db_table in query['sql'] for query in primary)
+        assert not any(
+            Token._meta.db_table in query['sql'] for query in replica
+        )
+
+
+class TestStickyPrimary:
+
+    def test_token_client_reads_primary_after_write(
+        self, user_client, another_user
+    ):
+        subscribe(user_client, another_user)
+        for url in REPLICA_URLS:
+            _, primary, replica = get_with_queries(user_client, url)
+            assert primary and not replica, (
+                f'После записи GET {url} этого клиента читает основную базу'
+            )
+
+    def test_session_client_reads_primary_after_write(self, client):
+        client.cookies['sessionid'] = 'test-session'
+        response = client.post('/api/users/', {
+            'email': 'new@foodgram.fake',
+            'username': 'NewUser',
+            'first_name': 'New',
+            'last_name': 'User',
+            'password': 'Pa$$w0rd-for-test',
+        })
+        assert response.status_code == 201
+        _, primary, replica = get_with_queries(client, '/api/recipes/')
+        assert primary and not replica
+
+    def test_other_clients_keep_reading_replica(
+        self, user_client, another_user
+    ):
+        subscribe(user_client, another_user)
+        token = Token.objects.create(user=another_user)
+        other_client = APIClient()
+        other_client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        _, _, replica = get_with_queries(other_client, '/api/recipes/')
+        assert replica
+
+    def test_failed_write_does_not_stick(self, user_client, user):
+        response = user_client.post(f'/api/users/{user.id}/subscribe/')
+        assert response.status_code == 400
+        _, _, replica = get_with_queries(user_client, '/api/recipes/')
+        assert replica, 'Неудачный запрос не привязывает к основной базе'
+
+    def test_sticky_window_expires(self, user_client, another_user, settings):
+        settings.DATABASE_REPLICA_STICKY_SECONDS = -1
+        subscribe(user_client, another_user)
+        _, _, replica = get_with_queries(user_client, '/api/recipes/')
+        assert replica